@@ -1,10 +1,25 @@
 import json
 import asyncio
-from datetime import datetime
-from typing import Dict, Any, Optional
+import logging
+import secrets
+import time
+from datetime import datetime, timezone
+from types import MappingProxyType
+from typing import Dict, Any, Optional, Union
 
 from bedrock_agentcore import BedrockAgentCoreApp
 from bedrock_agentcore.runtime.context import RequestContext
+from starlette.responses import Response
+
+# Fast JSON encoding for the response envelope (optional dependency)
+try:
+    import orjson
+except ImportError:
+    # Fallback: AgentCore serializes the returned dict with the stdlib json module
+    orjson = None
+
+# Response timestamps are UTC so they are unambiguous across deployments
+_UTC = timezone.utc
 
 
 # Import your existing text-to-sql function
@@ -25,8 +40,17 @@ from customer_service_agent import CustomerServiceOrchestrator
 # Create AgentCore app instance
 app = BedrockAgentCoreApp(debug=True)
 
+# Runtime logger (shares the handler configured by customer_service_agent)
+logger = logging.getLogger("CustomerService.AgentCore")
+
+# Static metadata added to every request (read-only to avoid accidental mutation)
+_BASE_META = MappingProxyType({
+    "source": "agentcore_runtime",
+    "service": "customer_service_agent",
+})
+
 
-def validate_agentcore_payload(payload: Dict[str, Any]) -> tuple[bool, Optional[str], Optional[str], Optional[Dict], Optional[str]]:
+def validate_agentcore_payload(payload: Dict[str, Any], timestamp_iso: str) -> tuple[bool, Optional[str], Optional[str], Optional[Dict], Optional[str]]:
     """
     Validates AgentCore payload format for customer service agent
     
@@ -37,6 +61,10 @@ def validate_agentcore_payload(payload: Dict[str, Any]) -> tuple[bool, Optional[
         "metadata": {...}  # optional
     }
     
+    Args:
+        payload: Request payload
+        timestamp_iso: Request start time (ISO 8601) already computed by the caller
+    
     Returns:
         tuple: (is_valid, user_query, user_id, metadata, error_message)
     """
@@ -51,13 +79,9 @@ def validate_agentcore_payload(payload: Dict[str, Any]) -> tuple[bool, Optional[
         if not user_id:
             return False, None, None, None, "Campo 'user_id' es requerido y no puede estar vacío"
         
-        # Extract optional metadata
-        metadata = payload.get("metadata", {})
-        
-        # Add AgentCore context to metadata
-        metadata["source"] = "agentcore_runtime"
-        metadata["service"] = "customer_service_agent"
-        metadata["timestamp"] = datetime.now().isoformat()
+        # Extract optional metadata and add AgentCore context in one step
+        # (base fields and timestamp always override client-supplied values)
+        metadata = {**payload.get("metadata", {}), **_BASE_META, "timestamp": timestamp_iso}
         
         return True, user_query, user_id, metadata, None
         
@@ -65,11 +89,46 @@ def validate_agentcore_payload(payload: Dict[str, Any]) -> tuple[bool, Optional[
         return False, None, None, None, f"Error validando payload: {str(e)}"
 
 
+def to_json_response(payload: Dict[str, Any]) -> Union[Dict[str, Any], Response]:
+    """
+    Pre-encodes the response envelope with orjson when available
+    
+    AgentCore passes Starlette responses through untouched, so handing it
+    already-encoded bytes skips the stdlib json.dumps on the way out.
+    
+    Returns:
+        Response with UTF-8 JSON body, or the original dict if orjson is missing
+        or cannot encode it (e.g. integers beyond 64 bits in client metadata)
+    """
+    if orjson is None:
+        return payload
+    try:
+        return Response(orjson.dumps(payload), media_type="application/json")
+    except TypeError as e:
+        # orjson.JSONEncodeError subclasses TypeError; the stdlib encoder handles these values
+        logger.warning("⚠️ orjson could not encode response, falling back to default serialization: %s", e)
+        return payload
+
+
 @app.entrypoint
-async def customer_service_agent(payload: Dict[str, Any], context: RequestContext) -> Dict[str, Any]:
+async def customer_service_agent(payload: Dict[str, Any], context: RequestContext) -> Union[Dict[str, Any], Response]:
     """
     AgentCore entrypoint for customer service agent processing
     
+    Args:
+        payload: Request payload with prompt, user_id, and optional metadata
+        context: AgentCore request context with session management and memory
+        
+    Returns:
+        JSON response with success status, response, and execution details
+    """
+    return to_json_response(await process_customer_service_request(payload, context))
+
+
+async def process_customer_service_request(payload: Dict[str, Any], context: RequestContext) -> Dict[str, Any]:
+    """
+    Processes a customer service request and builds the response envelope
+    
     Args:
         payload: Request payload with prompt, user_id, and optional metadata
         context: AgentCore request context with session management and memory
@@ -77,12 +136,15 @@ async def customer_service_agent(payload: Dict[str, Any], context: RequestContex
     Returns:
         Dict with success status, response, and execution details
     """
-    start_time = datetime.now()
-    session_id = context.session_id
+    # Monotonic clock for durations; wall clock only for the ISO timestamps
+    t0 = time.perf_counter()
+    start_time_iso = datetime.now(_UTC).isoformat()
+    # Mint a random session id when AgentCore doesn't provide one (collision-free under load)
+    session_id = context.session_id or f"agentcore_{secrets.token_hex(8)}"
     
     try:
         # Validate payload format
-        is_valid, user_query, user_id, metadata, error_message = validate_agentcore_payload(payload)
+        is_valid, user_query, user_id, metadata, error_message = validate_agentcore_payload(payload, start_time_iso)
         
         if not is_valid:
             return {
@@ -90,7 +152,7 @@ async def customer_service_agent(payload: Dict[str, Any], context: RequestContex
                 "error": {
                     "message": error_message,
                     "session_id": session_id,
-                    "timestamp": start_time.isoformat(),
+                    "timestamp": start_time_iso,
                     "source": "agentcore_validation"
                 }
             }
@@ -101,29 +163,23 @@ async def customer_service_agent(payload: Dict[str, Any], context: RequestContex
         metadata["session_id"] = session_id
         metadata["agentcore_context"] = True
         
-        print(f"🚀 [AgentCore] Processing customer service query for user '{user_id}' in session '{session_id}'")
-        print(f"📝 Query: {user_query}")
+        logger.info("🚀 [AgentCore] Processing customer service query for user '%s' in session '%s' | Query: %s", user_id, session_id, user_query)
         
         # Create customer service orchestrator with AgentCore context
         orchestrator = CustomerServiceOrchestrator(context)
         
-        # Process message using customer service agent
-        response = orchestrator.chat(user_query, user_id)
-        
-        end_time = datetime.now()
-        processing_time = (end_time - start_time).total_seconds()
-        
-        # Extract execution details from response for metadata
-        tools_used = ["search_knowledge_base", "knowledge_assistant"] if "base de conocimientos" in response.lower() else []
-        if "escalando a agente humano" in response.lower():
-            tools_used.append("escalate_to_human")
-        
-        agents_involved = ["orchestrator"]
-        if tools_used:
-            agents_involved.extend(["knowledge_assistant"] if "knowledge_assistant" in tools_used else [])
+        # Process message using customer service agent (non-blocking);
+        # the pooled agent goes back for the next request either way
+        try:
+            result = await orchestrator.achat(user_query, user_id)
+        finally:
+            orchestrator.close()
+        response = result.text
         
-        bedrock_queries = response.lower().count("bedrock") + response.lower().count("base de conocimientos")
+        processing_time = time.perf_counter() - t0
+        end_time_iso = datetime.now(_UTC).isoformat()
         
+        # Execution details come from the orchestrator's actual tool trace
         return {
             "success": True,
             "data": {
@@ -131,12 +187,12 @@ async def customer_service_agent(payload: Dict[str, Any], context: RequestContex
                 "session_info": {
                     "session_id": session_id,
                     "user_id": user_id,
-                    "timestamp": end_time.isoformat()
+                    "timestamp": end_time_iso
                 },
                 "execution_details": {
-                    "tools_used": tools_used,
-                    "agents_involved": agents_involved,
-                    "bedrock_queries": bedrock_queries,
+                    "tools_used": result.tools_used,
+                    "agents_involved": result.agents_involved,
+                    "bedrock_queries": result.bedrock_query_count,
                     "processing_time_seconds": processing_time,
                     "memory_context": bool(context and hasattr(context, 'memory')),
                     "conversation_history_available": True
@@ -146,11 +202,10 @@ async def customer_service_agent(payload: Dict[str, Any], context: RequestContex
         }
             
     except Exception as e:
-        end_time = datetime.now()
-        processing_time = (end_time - start_time).total_seconds()
+        processing_time = time.perf_counter() - t0
         
         error_msg = f"Error crítico en AgentCore customer service: {str(e)}"
-        print(f"❌ {error_msg}")
+        logger.error("❌ %s", error_msg)
         
         return {
             "success": False,
@@ -160,7 +215,7 @@ async def customer_service_agent(payload: Dict[str, Any], context: RequestContex
                 "session_id": session_id,
                 "user_id": user_id if 'user_id' in locals() else None,
                 "processing_time_seconds": processing_time,
-                "timestamp": end_time.isoformat()
+                "timestamp": datetime.now(_UTC).isoformat()
             }
         }
 
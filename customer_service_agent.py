@@ -11,19 +11,36 @@ Fecha: 2025
 """
 
 import os
+import re
+import json
+import time
+import asyncio
+import atexit
+import inspect
+import hashlib
+import secrets
 import logging
+import threading
+import queue
+import io
+import unicodedata
 import boto3
-from datetime import datetime
-from typing import Dict, List, Optional, Any
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import cached_property, lru_cache, partial
+from operator import itemgetter
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Any
 from strands import Agent, tool
-from strands.models.ollama import OllamaModel
-from strands.models.bedrock import BedrockModel
-from strands.models.openai import OpenAIModel
-from strands.models.anthropic import AnthropicModel
-from strands_tools import http_request, file_read, file_write
+from strands.telemetry.metrics import EventLoopMetrics
+from strands.agent.conversation_manager import SlidingWindowConversationManager
+from strands.agent.state import AgentState
 from botocore.client import Config
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
+from intent_router import route_trivial_intent
 
 # Import AgentCore context for memory management
 try:
@@ -32,6 +49,15 @@ except ImportError:
     # Fallback for testing without AgentCore
     RequestContext = None
 
+# Dependencias opcionales para la caché semántica (embeddings + FAISS)
+try:
+    import faiss
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    # Sin estas dependencias la caché semántica queda deshabilitada
+    faiss = None
+    SentenceTransformer = None
+
 load_dotenv()
 
 # Configuración de logging estructurado
@@ -63,14 +89,31 @@ OLLAMA_CONFIG = {
     "top_p": 0.9,
 }
 
-BEDROCK_CONFIG = {
-    "model_id": "anthropic.claude-3-sonnet-20240229-v1:0",
-    "region": "us-east-1",
-    "connect_timeout": 120,
-    "read_timeout": 120,
+# Región del cliente de Bedrock: la inferencia optimizada para latencia de Claude 3.5 Haiku
+# solo está disponible en us-east-2. Va aparte porque BedrockModel la recibe como argumento
+# (region_name), no como parte de la configuración del modelo
+BEDROCK_CONFIG_REGION = "us-east-2"
+
+# Cliente boto3 del modelo; BedrockModel solo lo acepta como botocore Config (boto_client_config).
+# Una región inalcanzable debe fallar rápido (el timeout se paga en cada uno de los max_attempts);
+# read_timeout es el tiempo máximo entre fragmentos del stream, no la duración de la respuesta
+BEDROCK_CLIENT_CONFIG = {
+    "connect_timeout": 5,
+    "read_timeout": 30,
     "max_attempts": 3
 }
 
+BEDROCK_CONFIG = {
+    # Claude 3.5 Haiku vía perfil de inferencia de EE. UU.: soporta inferencia optimizada
+    # para latencia (en us-east-2) y prompt caching; Claude 3 Sonnet no soporta ninguno
+    "model_id": "us.anthropic.claude-3-5-haiku-20241022-v1:0",
+    # Inferencia optimizada para latencia (parámetro de nivel superior de Converse)
+    "additional_args": {"performanceConfig": {"latency": "optimized"}},
+    # Prompt caching: punto de caché tras el system prompt y el esquema de herramientas
+    "cache_prompt": "default",
+    "cache_tools": "default"
+}
+
 OPENAI_CONFIG = {
     "client_args": {
         "api_key": os.getenv("OPENAI_API_KEY"),
@@ -79,6 +122,20 @@ OPENAI_CONFIG = {
     "params": {
         "max_tokens": 1000,
         "temperature": 0.7,
+        # Prompt caching automático de OpenAI: la llave enruta las peticiones con el mismo
+        # prefijo (system prompt + herramientas) al mismo servidor para reutilizar su KV-cache
+        "extra_body": {"prompt_cache_key": "sac-agent-customer-service"},
+    }
+}
+
+ANTHROPIC_CONFIG = {
+    "client_args": {
+        "api_key": os.getenv("ANTHROPIC_API_KEY"),
+    },
+    "model_id": "claude-3-5-haiku-latest",
+    "max_tokens": 1000,
+    "params": {
+        "temperature": 0.7,
     }
 }
 
@@ -86,26 +143,264 @@ OPENAI_CONFIG = {
 AWS_CONFIG = {
     "region": "us-west-2",  # Cambiar según tu región preferida
     "model_id": "anthropic.claude-3-sonnet-20240229-v1:0",  # Solo para referencia, no se usa
-    "connect_timeout": 120,
-    "read_timeout": 120,
-    "max_attempts": 3
+    # Retrieve es una búsqueda sin generación: responde en segundos, y 30 s de lectura cubren un
+    # vector store lento. Un endpoint inalcanzable falla en 5 s y el turno pasa al fallback local
+    # (ambos timeouts se pagan en cada uno de los max_attempts: antes hasta 3 x 120 s)
+    "connect_timeout": 5,
+    "read_timeout": 30,
+    "max_attempts": 3,
+    "max_pool_connections": 64,  # Conexiones HTTP reutilizables (keep-alive)
+    "max_concurrency": 32,  # Consultas concurrentes máximas a la Knowledge Base
+    # Tipo de búsqueda de la Knowledge Base: "HYBRID" (vectorial + texto) o "SEMANTIC".
+    # Sin definir, Bedrock elige; HYBRID solo lo soportan algunos vector stores
+    "search_type": os.getenv("KB_SEARCH_TYPE")
 }
 
 # ID de la Knowledge Base (debe ser configurado para tu KB específica)
 KNOWLEDGE_BASE_ID = os.getenv("KNOWLEDGE_BASE_ID")  # Reemplaza con tu Knowledge Base ID real
 
+# Configuración de caché de respuestas de la Knowledge Base
+KB_CACHE_CONFIG = {
+    "maxsize": 2048,  # Entradas máximas en memoria
+    "ttl": 300  # Segundos antes de expirar una respuesta cacheada
+}
+
+# Configuración de caché del historial por sesión (evita releer AgentCore Memory en cada turno)
+HISTORY_CACHE_CONFIG = {
+    "maxsize": 1024,  # Sesiones en memoria
+    "ttl": 300  # Segundos; después se vuelve a leer del backend
+}
+
+# Configuración de caché de respuestas del knowledge_assistant (FAQ)
+KNOWLEDGE_CACHE_CONFIG = {
+    "maxsize": 1024,
+    "ttl": 3600,
+    "min_query_length": 3  # Consultas más cortas no se cachean
+}
+
+# Configuración de caché de respuestas completas del orchestrator (primer turno de cada sesión)
+RESPONSE_CACHE_CONFIG = {
+    "maxsize": 1024,
+    "ttl": 3600
+}
+
+# Configuración de caché semántica (consultas parafraseadas)
+SEMANTIC_CACHE_CONFIG = {
+    "enabled": os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true",
+    "model_name": "paraphrase-multilingual-MiniLM-L12-v2",  # Multilingüe: consultas en español
+    "threshold": 0.92,  # Similitud coseno mínima para considerar un hit
+    "maxsize": 4096,
+    "ttl": 3600,
+    "index_path": os.getenv("SEMANTIC_CACHE_PATH")  # Persistencia opcional en disco
+}
+
+class TTLCache:
+    """Caché LRU acotada con expiración por tiempo, segura entre hilos."""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: Any, default: Any = None) -> Any:
+        """Retorna el valor cacheado o `default` si no existe o ya expiró."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key: Any, value: Any) -> None:
+        """Guarda un valor, desalojando la entrada menos usada si se excede maxsize."""
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def discard(self, key: Any) -> None:
+        """Elimina la entrada si existe."""
+        with self._lock:
+            self._data.pop(key, None)
+    
+    def clear(self) -> None:
+        """Vacía la caché."""
+        with self._lock:
+            self._data.clear()
+
+@lru_cache(maxsize=None)
+def _load_embedding_model(model_name: str):
+    """Carga el modelo de embeddings una sola vez; todas las cachés semánticas lo comparten."""
+    return SentenceTransformer(model_name)
+
+class SemanticCache:
+    """Caché semántica: reutiliza valores de consultas similares (embeddings + FAISS)."""
+    
+    def __init__(self, threshold: float, model_name: str, maxsize: int, ttl: float,
+                 index_path: Optional[str] = None, enabled: bool = True, persist_every: int = 32):
+        self.threshold = threshold
+        self.model_name = model_name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.index_path = index_path
+        self.persist_every = persist_every
+        self.enabled = enabled and faiss is not None and SentenceTransformer is not None
+        self._model = None
+        self._index = None
+        self._entries: List[tuple] = []  # (expira_en, valor) en el mismo orden que el índice
+        self._last_embedding: tuple = (None, None)
+        self._unsaved = 0  # Inserciones pendientes de persistir
+        self._lock = threading.Lock()
+        if self.enabled and self.index_path:
+            atexit.register(self.flush)
+    
+    def _ensure_loaded(self) -> None:
+        """Carga el modelo de embeddings y el índice en el primer uso."""
+        if self._model is not None:
+            return
+        model = _load_embedding_model(self.model_name)
+        index, entries = None, []
+        if self.index_path and os.path.exists(self.index_path):
+            try:
+                index = faiss.read_index(self.index_path)
+                with open(f"{self.index_path}.json", encoding="utf-8") as f:
+                    entries = [tuple(entry) for entry in json.load(f)]
+                if index.ntotal != len(entries):
+                    raise ValueError(f"index has {index.ntotal} vectors but sidecar has {len(entries)} entries")
+                logger.info("🧩 SEMANTIC CACHE: Loaded %d entries from %s", len(entries), self.index_path)
+            except Exception as e:
+                logger.warning("🧩 SEMANTIC CACHE: Could not load %s, starting empty - %s", self.index_path, e)
+                index, entries = None, []
+        if index is None:
+            index = faiss.IndexFlatIP(model.get_sentence_embedding_dimension())
+        # El modelo se asigna al final: si la carga falla, el próximo uso reintenta
+        self._index, self._entries = index, entries
+        self._model = model
+    
+    def _embed(self, text: str):
+        """Calcula el embedding normalizado, reutilizando el de la última consulta."""
+        last_text, last_embedding = self._last_embedding
+        if last_text == text:
+            return last_embedding
+        embedding = self._model.encode([text], normalize_embeddings=True)
+        self._last_embedding = (text, embedding)
+        return embedding
+    
+    def _evict(self) -> None:
+        """Libera espacio: descarta las entradas expiradas y, si no basta, la cuarta parte más antigua."""
+        # Todas las entradas comparten el TTL, así que el orden de inserción es el de expiración
+        now = time.time()
+        expired = 0
+        while expired < len(self._entries) and self._entries[expired][0] < now:
+            expired += 1
+        drop = max(expired, self.maxsize // 4, 1)
+        self._index.remove_ids(faiss.IDSelectorRange(0, drop))
+        del self._entries[:drop]
+    
+    def get(self, text: str) -> Any:
+        """Retorna el valor de la consulta más similar si supera el umbral, o None."""
+        if not self.enabled:
+            return None
+        try:
+            with self._lock:
+                self._ensure_loaded()
+                if self._index.ntotal == 0:
+                    return None
+                scores, ids = self._index.search(self._embed(text), 1)
+                if scores[0][0] < self.threshold:
+                    return None
+                expires_at, value = self._entries[ids[0][0]]
+                return value if expires_at >= time.time() else None
+        except Exception as e:
+            # Un fallo de la caché nunca debe afectar la respuesta
+            logger.warning("🧩 SEMANTIC CACHE: Lookup failed - %s", e)
+            return None
+    
+    def set(self, text: str, value: Any) -> None:
+        """Agrega una consulta y su valor al índice, desalojando entradas si está lleno."""
+        if not self.enabled:
+            return
+        try:
+            with self._lock:
+                self._ensure_loaded()
+                if self._index.ntotal >= self.maxsize:
+                    self._evict()
+                self._index.add(self._embed(text))
+                self._entries.append((time.time() + self.ttl, value))
+                self._unsaved += 1
+                if self._unsaved < self.persist_every:
+                    return
+            self.flush()
+        except Exception as e:
+            logger.warning("🧩 SEMANTIC CACHE: Insert failed - %s", e)
+    
+    def flush(self) -> None:
+        """Persiste el índice y sus valores en disco (si hay index_path y cambios pendientes)."""
+        if not self.index_path:
+            return
+        try:
+            # Snapshot bajo el lock; la escritura a disco ocurre fuera de él
+            with self._lock:
+                if self._index is None or not self._unsaved:
+                    return
+                index_bytes = faiss.serialize_index(self._index)
+                entries_json = json.dumps(self._entries, ensure_ascii=False)
+                self._unsaved = 0
+            index_bytes.tofile(self.index_path)
+            with open(f"{self.index_path}.json", "w", encoding="utf-8") as f:
+                f.write(entries_json)
+        except Exception as e:
+            logger.warning("🧩 SEMANTIC CACHE: Could not persist %s - %s", self.index_path, e)
+
+@dataclass
+class KnowledgeBaseTrace:
+    """Uso de la Knowledge Base durante una invocación de agente."""
+    
+    bedrock_queries: int = 0  # Retrieve reales a Bedrock (sin hits de caché)
+    local_fallbacks: int = 0  # Respuestas servidas por la base local de fallback
+    uncacheable: bool = False  # Algún subagente respondió con datos del momento o con error
+    
+    def merge(self, other: "KnowledgeBaseTrace") -> None:
+        """Acumula la traza de una invocación anidada."""
+        self.bedrock_queries += other.bedrock_queries
+        self.local_fallbacks += other.local_fallbacks
+        self.uncacheable = self.uncacheable or other.uncacheable
+
+# Traza de la invocación en curso. Quien invoca a un agente fija una traza nueva; el
+# contexto se propaga a las tareas de las herramientas y a los subagentes
+_kb_trace: ContextVar[Optional[KnowledgeBaseTrace]] = ContextVar("kb_trace", default=None)
+
 class BedrockKnowledgeBaseClient:
     """Cliente para interactuar con AWS Bedrock Knowledge Base (solo para recuperación)."""
     
     def __init__(self, region: str = None, knowledge_base_id: str = None):
         self.region = region or AWS_CONFIG["region"]
         self.knowledge_base_id = knowledge_base_id or KNOWLEDGE_BASE_ID
+        self.search_type = AWS_CONFIG["search_type"]
         
         # Configuración de cliente boto3
         bedrock_config = Config(
             connect_timeout=AWS_CONFIG["connect_timeout"],
             read_timeout=AWS_CONFIG["read_timeout"],
-            retries={'max_attempts': AWS_CONFIG["max_attempts"]}
+            # Modo adaptativo: limita la tasa del lado del cliente ante throttling de Bedrock
+            retries={'max_attempts': AWS_CONFIG["max_attempts"], 'mode': 'adaptive'},
+            max_pool_connections=AWS_CONFIG["max_pool_connections"],
+            tcp_keepalive=True
+        )
+        
+        self._config = bedrock_config
+        
+        # Pool de hilos propio para la ruta asíncrona: acota las consultas concurrentes a
+        # max_concurrency sin competir con el executor por defecto (memoria, caché semántica)
+        self._executor = ThreadPoolExecutor(
+            max_workers=AWS_CONFIG["max_concurrency"],
+            thread_name_prefix="bedrock-kb"
         )
         
         try:
@@ -116,20 +411,23 @@ class BedrockKnowledgeBaseClient:
                 config=bedrock_config
             )
             
-            # Cliente para operaciones de administración
-            self.bedrock_agent = boto3.client(
-                "bedrock-agent",
-                region_name=self.region,
-                config=bedrock_config
-            )
-            
-            logger.info(f"✅ Cliente Bedrock inicializado para región: {self.region}")
+            logger.info("✅ Cliente Bedrock inicializado para región: %s", self.region)
             
         except Exception as e:
-            logger.error(f"❌ Error inicializando cliente Bedrock: {e}")
+            logger.error("❌ Error inicializando cliente Bedrock: %s", e)
             raise
     
-    def retrieve(self, query: str, max_results: int = 20, min_score: float = 0.1) -> Dict[str, Any]:
+    @cached_property
+    def bedrock_agent(self):
+        """Cliente para operaciones de administración, creado solo si se llega a usar."""
+        return boto3.client(
+            "bedrock-agent",
+            region_name=self.region,
+            config=self._config
+        )
+    
+    def retrieve(self, query: str, max_results: int = 10, min_score: float = 0.1,
+                 content_limit: Optional[int] = None) -> Dict[str, Any]:
         """
         Recupera información relevante de la Knowledge Base sin generar respuesta.
         
@@ -137,12 +435,17 @@ class BedrockKnowledgeBaseClient:
             query: Consulta a realizar
             max_results: Número máximo de resultados
             min_score: Puntuación mínima de relevancia
+            content_limit: Caracteres máximos del contenido de cada resultado (None: completo)
             
         Returns:
             Diccionario con los resultados de la búsqueda
         """
         try:
-            logger.info(f"🔍 BEDROCK RETRIEVE: '{query}' (max={max_results}, min_score={min_score})")
+            logger.info("🔍 BEDROCK RETRIEVE: '%s' (max=%s, min_score=%s)", query, max_results, min_score)
+            
+            vector_search_config = {'numberOfResults': max_results}
+            if self.search_type:
+                vector_search_config['overrideSearchType'] = self.search_type
             
             response = self.bedrock_agent_runtime.retrieve(
                 knowledgeBaseId=self.knowledge_base_id,
@@ -150,28 +453,32 @@ class BedrockKnowledgeBaseClient:
                     'text': query
                 },
                 retrievalConfiguration={
-                    'vectorSearchConfiguration': {
-                        'numberOfResults': max_results,
-                    }
+                    'vectorSearchConfiguration': vector_search_config
                 }
             )
             
-            # Procesar y filtrar resultados por score
-            results = []
-            for result in response.get('retrievalResults', []):
-                score = result.get('score', 0.0)
-                if score >= min_score:
-                    results.append({
-                        'content': result.get('content', {}).get('text', ''),
-                        'score': score,
-                        'location': result.get('location', {}),
-                        'metadata': result.get('metadata', {})
-                    })
+            # Filtrar por score leyendo cada puntuación una sola vez
+            scored = [
+                (result.get('score', 0.0), result)
+                for result in response.get('retrievalResults', [])
+            ]
+            scored = [item for item in scored if item[0] >= min_score]
+            
+            # Ordenar por score descendente con una clave nativa (sin lambda)
+            scored.sort(key=itemgetter(0), reverse=True)
             
-            # Ordenar por score descendente
-            results.sort(key=lambda x: x['score'], reverse=True)
+            # Construir los diccionarios solo para los resultados que sobreviven
+            results = [
+                {
+                    'content': result.get('content', {}).get('text', '')[:content_limit],
+                    'score': score,
+                    'location': result.get('location', {}),
+                    'metadata': result.get('metadata', {})
+                }
+                for score, result in scored
+            ]
             
-            logger.info(f"📊 BEDROCK RETRIEVE RESULTS: {len(results)} resultados encontrados")
+            logger.info("📊 BEDROCK RETRIEVE RESULTS: %d resultados encontrados", len(results))
             
             return {
                 'results': results,
@@ -181,7 +488,7 @@ class BedrockKnowledgeBaseClient:
             }
             
         except ClientError as e:
-            logger.error(f"❌ Error en Bedrock retrieve: {e}")
+            logger.error("❌ Error en Bedrock retrieve: %s", e)
             return {
                 'results': [],
                 'total_results': 0,
@@ -189,16 +496,85 @@ class BedrockKnowledgeBaseClient:
                 'error': str(e)
             }
         except Exception as e:
-            logger.error(f"❌ Error inesperado en retrieve: {e}")
+            logger.error("❌ Error inesperado en retrieve: %s", e)
             return {
                 'results': [],
                 'total_results': 0,
                 'query': query,
                 'error': str(e)
             }
+    
+    async def aretrieve(self, query: str, max_results: int = 10, min_score: float = 0.1,
+                        content_limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Versión asíncrona de retrieve() que no bloquea el event loop.
+        
+        El cliente boto3 es thread-safe y comparte su pool de conexiones, por lo que
+        la llamada se delega al pool de hilos dedicado del cliente (max_concurrency hilos).
+        
+        Args:
+            query: Consulta a realizar
+            max_results: Número máximo de resultados
+            min_score: Puntuación mínima de relevancia
+            content_limit: Caracteres máximos del contenido de cada resultado (None: completo)
+            
+        Returns:
+            Diccionario con los resultados de la búsqueda
+        """
+        trace = _kb_trace.get()
+        if trace is not None:
+            trace.bedrock_queries += 1
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.retrieve, query, max_results, min_score, content_limit)
+    
+    async def aretrieve_many(self, queries: List[str], max_results: int = 10, min_score: float = 0.1,
+                             content_limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Ejecuta varias consultas a la Knowledge Base de forma concurrente.
+        
+        Args:
+            queries: Consultas a realizar
+            max_results: Número máximo de resultados por consulta
+            min_score: Puntuación mínima de relevancia
+            content_limit: Caracteres máximos del contenido de cada resultado (None: completo)
+            
+        Returns:
+            Lista de resultados en el mismo orden que `queries`
+        """
+        return list(await asyncio.gather(*(self.aretrieve(q, max_results, min_score, content_limit) for q in queries)))
+
+@lru_cache(maxsize=1)
+def get_bedrock_client() -> BedrockKnowledgeBaseClient:
+    """Cliente Bedrock compartido (un solo pool de conexiones por proceso), creado en el primer uso."""
+    return BedrockKnowledgeBaseClient()
+
+# Un proceso hijo (p. ej. workers con fork) no hereda un cliente utilizable: sus conexiones
+# y los hilos del pool pertenecen al padre, así que el hijo crea el suyo en el primer uso
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=get_bedrock_client.cache_clear)
+
+# Base de conocimientos básica local para fallback
+LOCAL_KNOWLEDGE = {
+    "soporte": "Para soporte técnico, puedes contactarnos al +1-234-567-8900 o soporte@empresa.com",
+    "horarios": "Nuestros horarios de atención son de lunes a viernes de 9:00 AM a 6:00 PM",
+    "productos": "Ofrecemos una amplia gama de productos y servicios empresariales",
+    "cuenta": "Para consultas sobre tu cuenta, necesitaremos verificar tu identidad",
+    "facturación": "Las consultas de facturación se procesan en horario comercial"
+}
+
+# Autómata de palabras clave compilado una sola vez: una pasada sobre la consulta
+# sin importar cuántas entradas tenga la base local
+_LOCAL_KB_PATTERN = re.compile(
+    "|".join(re.escape(keyword.lower()) for keyword in sorted(LOCAL_KNOWLEDGE, key=len, reverse=True))
+)
 
-# Instancia global del cliente Bedrock
-bedrock_client = BedrockKnowledgeBaseClient()
+# Respuestas ya formateadas por palabra clave (en minúsculas) y respuesta genérica
+_LOCAL_KB_RESPONSES = {
+    keyword.lower(): f"ℹ️ **Información básica**: {response}\n\n💡 *Nota: Esta es información básica. Para respuestas más detalladas, recomendamos contactar a nuestro equipo de soporte.*"
+    for keyword, response in LOCAL_KNOWLEDGE.items()
+}
+_LOCAL_KB_FALLBACK = "ℹ️ **No encontré información específica sobre tu consulta**\n\nTe recomiendo:\n• Contactar soporte: +1-234-567-8900\n• Email: soporte@empresa.com\n• Reformular tu pregunta con términos más específicos"
 
 def search_local_knowledge_base(query: str) -> str:
     """
@@ -210,71 +586,158 @@ def search_local_knowledge_base(query: str) -> str:
     Returns:
         str: Respuesta de fallback
     """
-    tools_logger.info(f"🔧 LOCAL KB FALLBACK: Query: '{query}'")
-    
-    # Base de conocimientos básica local para fallback
-    local_knowledge = {
-        "soporte": "Para soporte técnico, puedes contactarnos al +1-234-567-8900 o soporte@empresa.com",
-        "horarios": "Nuestros horarios de atención son de lunes a viernes de 9:00 AM a 6:00 PM",
-        "productos": "Ofrecemos una amplia gama de productos y servicios empresariales",
-        "cuenta": "Para consultas sobre tu cuenta, necesitaremos verificar tu identidad",
-        "facturación": "Las consultas de facturación se procesan en horario comercial"
-    }
+    tools_logger.info("🔧 LOCAL KB FALLBACK: Query: '%s'", query)
+    
+    trace = _kb_trace.get()
+    if trace is not None:
+        trace.local_fallbacks += 1
     
-    # Búsqueda simple por palabras clave
-    query_lower = query.lower()
-    for keyword, response in local_knowledge.items():
-        if keyword in query_lower:
-            tools_logger.info(f"🔧 LOCAL KB RESULT: Found match for keyword '{keyword}'")
-            return f"ℹ️ **Información básica**: {response}\n\n💡 *Nota: Esta es información básica. Para respuestas más detalladas, recomendamos contactar a nuestro equipo de soporte.*"
+    # Búsqueda por palabras clave en una sola pasada
+    match = _LOCAL_KB_PATTERN.search(query.lower())
+    if match:
+        keyword = match.group(0)
+        tools_logger.debug("🔧 LOCAL KB RESULT: Found match for keyword '%s'", keyword)
+        return _LOCAL_KB_RESPONSES[keyword]
     
-    tools_logger.info("🔧 LOCAL KB RESULT: No matches found, returning generic response")
-    return "ℹ️ **No encontré información específica sobre tu consulta**\n\nTe recomiendo:\n• Contactar soporte: +1-234-567-8900\n• Email: soporte@empresa.com\n• Reformular tu pregunta con términos más específicos"
+    tools_logger.debug("🔧 LOCAL KB RESULT: No matches found, returning generic response")
+    return _LOCAL_KB_FALLBACK
 
+# Las fábricas de modelos retornan una única instancia por proceso para
+# reutilizar el cliente HTTP/SDK (y su pool de conexiones) entre peticiones.
+# Cada proveedor se importa dentro de su fábrica: solo se carga el SDK que se usa.
+
+@lru_cache(maxsize=1)
 def create_model_ollama():
     """Crea y retorna una instancia del modelo configurado."""
+    from strands.models.ollama import OllamaModel
     return OllamaModel(**OLLAMA_CONFIG)
 
+@lru_cache(maxsize=1)
 def create_model_bedrock():
     """Crea y retorna una instancia del modelo configurado."""
-    return BedrockModel(**BEDROCK_CONFIG)
+    from strands.models.bedrock import BedrockModel
+    client_config = Config(
+        connect_timeout=BEDROCK_CLIENT_CONFIG["connect_timeout"],
+        read_timeout=BEDROCK_CLIENT_CONFIG["read_timeout"],
+        retries={'max_attempts': BEDROCK_CLIENT_CONFIG["max_attempts"], 'mode': 'adaptive'}
+    )
+    return BedrockModel(region_name=BEDROCK_CONFIG_REGION, boto_client_config=client_config, **BEDROCK_CONFIG)
 
-print(os.getenv("OPENAI_API_KEY"))
+@lru_cache(maxsize=1)
 def create_model_openai():
     """Crea y retorna una instancia del modelo configurado."""
-    return OpenAIModel(client_args={
-        "api_key": os.getenv("OPENAI_API_KEY"),
-    },
-    model_id="gpt-4o-mini",
-    params={
-        "max_tokens": 1000,
-        "temperature": 0.7,
-    })
+    from strands.models.openai import OpenAIModel
+    return OpenAIModel(**OPENAI_CONFIG)
 
+@lru_cache(maxsize=1)
 def create_model_anthropic():
     """Crea y retorna una instancia del modelo configurado."""
+    from strands.models.anthropic import AnthropicModel
     return AnthropicModel(**ANTHROPIC_CONFIG)
 
 # ==========================================
 # HERRAMIENTAS PERSONALIZADAS
 # ==========================================
 
+# Longitud máxima del contenido mostrado por cada resultado de la Knowledge Base
+_PREVIEW_LIMIT = 800
+# Las herramientas piden a Bedrock solo un carácter más que la vista previa: basta para que
+# _content_preview detecte el recorte sin retener (ni cachear) los fragmentos completos
+_RETRIEVE_CONTENT_LIMIT = _PREVIEW_LIMIT + 1
+
+def _content_preview(content: str, limit: int = _PREVIEW_LIMIT) -> str:
+    """Trunca el contenido a `limit` caracteres sin partir palabras; no copia si ya cabe."""
+    if len(content) <= limit:
+        return content
+    # Cortar en el último espacio dentro del límite (o en el límite si no hay ninguno)
+    cut = content.rfind(" ", 0, limit + 1)
+    return f"{content[:cut if cut > 0 else limit]}..."
+
+# Caché de respuestas formateadas de search_knowledge_base
+_kb_cache = TTLCache(maxsize=KB_CACHE_CONFIG["maxsize"], ttl=KB_CACHE_CONFIG["ttl"])
+
+def _kb_cache_key(query: str, max_results: int, min_score: float) -> bytes:
+    """Genera la llave de caché para una consulta normalizada a la Knowledge Base."""
+    normalized_query = query.strip().lower()
+    return hashlib.blake2b(f"{normalized_query}|{max_results}|{min_score}".encode(), digest_size=16).digest()
+
+# Segundo nivel (opcional): resultados de Bedrock para consultas parafraseadas. Un solo índice
+# para la Knowledge Base configurada; cada entrada guarda los parámetros con que se obtuvo
+# (max_results, min_score, resultados crudos) y se formatea con la consulta actual
+_kb_semantic_cache = SemanticCache(
+    threshold=SEMANTIC_CACHE_CONFIG["threshold"],
+    model_name=SEMANTIC_CACHE_CONFIG["model_name"],
+    maxsize=KB_CACHE_CONFIG["maxsize"],
+    ttl=KB_CACHE_CONFIG["ttl"],
+    enabled=SEMANTIC_CACHE_CONFIG["enabled"]
+)
+
+async def _kb_semantic_lookup(query: str, max_results: int, min_score: float) -> Optional[List[Dict[str, Any]]]:
+    """Busca resultados de Bedrock de una consulta similar (el embedding no bloquea el event loop)."""
+    if not _kb_semantic_cache.enabled:
+        return None
+    entry = await asyncio.to_thread(_kb_semantic_cache.get, query.strip().lower())
+    if entry is None:
+        return None
+    cached_max_results, cached_min_score, results = entry
+    # Los resultados guardados están ordenados por score: solo sirven si la consulta actual
+    # pide un subconjunto de ellos (no más resultados ni un umbral más bajo)
+    if max_results > cached_max_results or min_score < cached_min_score:
+        return None
+    return [result for result in results if result['score'] >= min_score][:max_results]
+
+async def _kb_semantic_store(query: str, max_results: int, min_score: float, results: List[Dict[str, Any]]) -> None:
+    """Guarda los resultados de Bedrock de la consulta (con sus parámetros) en la caché semántica."""
+    if _kb_semantic_cache.enabled:
+        await asyncio.to_thread(_kb_semantic_cache.set, query.strip().lower(), (max_results, min_score, results))
+
+# Formato de fecha/hora que se muestra al cliente
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
 @tool
-def get_current_time() -> str:
+async def get_current_time() -> str:
     """
     Obtiene la fecha y hora actual.
     
     Returns:
         str: Fecha y hora actual en formato legible
     """
-    tools_logger.info(f"🔧 TOOL INPUT: get_current_time | Params: none")
-    tools_logger.info(f"🔧 TOOL PROCESSING: get_current_time | Action: Getting current system time")
-    result = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    tools_logger.info(f"🔧 TOOL OUTPUT: get_current_time | Result: {result}")
+    tools_logger.debug("🔧 TOOL INPUT: get_current_time | Params: none")
+    tools_logger.debug("🔧 TOOL PROCESSING: get_current_time | Action: Getting current system time")
+    result = time.strftime(_TIME_FORMAT)
+    tools_logger.info("🔧 TOOL OUTPUT: get_current_time | Result: %s", result)
     return result
 
+def _format_kb_results(query: str, results: List[Dict[str, Any]], tool_name: str = "search_knowledge_base") -> str:
+    """Formatea los mejores resultados de Bedrock (máximo 3) como respuesta de la herramienta `tool_name`."""
+    total_results = len(results)
+    
+    # Tomar los mejores resultados (máximo 3 para no sobrecargar)
+    top_results = results[:3]
+    
+    tools_logger.debug("🔧 TOOL PROCESSING: %s | Action: Formatting %d top results from %s total", tool_name, len(top_results), total_results)
+    
+    # Limitar longitud del contenido de cada resultado
+    formatted_results = [
+        f"📄 **Resultado {i}** (relevancia: {result['score']:.2f})\n{_content_preview(result['content'])}"
+        for i, result in enumerate(top_results, 1)
+    ]
+    
+    extra_results_note = (
+        f"\n\n💡 *Se encontraron {total_results - 3} resultados adicionales. Puedes hacer una consulta más específica para obtener información más precisa.*"
+        if total_results > 3 else ""
+    )
+    
+    # Una sola concatenación para toda la respuesta
+    return "".join((
+        "🔍 **Información encontrada en la base de conocimientos:**\n\n",
+        f"📊 **{total_results} resultados** para: \"{query}\"\n\n",
+        "\n\n".join(formatted_results),
+        extra_results_note,
+    ))
+
 @tool
-def search_knowledge_base(query: str, max_results: int = 15, min_score: float = 0.1) -> str:
+async def search_knowledge_base(query: str, max_results: int = 10, min_score: float = 0.1) -> str:
     """
     Busca información en la base de conocimientos de AWS Bedrock.
     
@@ -286,81 +749,133 @@ def search_knowledge_base(query: str, max_results: int = 15, min_score: float =
     Returns:
         str: Información relevante encontrada
     """
-    tools_logger.info(f"🔧 TOOL INPUT: search_knowledge_base | Params: query='{query}', max_results={max_results}, min_score={min_score}")
+    tools_logger.debug("🔧 TOOL INPUT: search_knowledge_base | Params: query='%s', max_results=%s, min_score=%s", query, max_results, min_score)
+    
+    cache_key = _kb_cache_key(query, max_results, min_score)
+    cached_response = _kb_cache.get(cache_key)
+    if cached_response is not None:
+        tools_logger.info("🔧 TOOL OUTPUT: search_knowledge_base | Result: Cache hit | Response length: %d chars", len(cached_response))
+        return cached_response
+    
+    cached_results = await _kb_semantic_lookup(query, max_results, min_score)
+    if cached_results is not None:
+        formatted_response = _format_kb_results(query, cached_results)
+        _kb_cache.set(cache_key, formatted_response)
+        tools_logger.info("🔧 TOOL OUTPUT: search_knowledge_base | Result: Semantic cache hit | Response length: %d chars", len(formatted_response))
+        return formatted_response
     
     try:
-        tools_logger.info(f"🔧 TOOL PROCESSING: search_knowledge_base | Action: Calling Bedrock Knowledge Base retrieve")
+        tools_logger.debug("🔧 TOOL PROCESSING: search_knowledge_base | Action: Calling Bedrock Knowledge Base retrieve")
         
         # Búsqueda en Bedrock Knowledge Base
-        results = bedrock_client.retrieve(query, max_results, min_score)
+        results = await get_bedrock_client().aretrieve(query, max_results, min_score, _RETRIEVE_CONTENT_LIMIT)
         
         if results.get('error'):
-            tools_logger.error(f"🔧 TOOL ERROR: search_knowledge_base | Bedrock error: {results['error']}")
-            tools_logger.info(f"🔧 TOOL PROCESSING: search_knowledge_base | Action: Falling back to local knowledge base")
+            tools_logger.error("🔧 TOOL ERROR: search_knowledge_base | Bedrock error: %s", results['error'])
+            tools_logger.debug("🔧 TOOL PROCESSING: search_knowledge_base | Action: Falling back to local knowledge base")
             return search_local_knowledge_base(query)
         
         if not results['results']:
-            tools_logger.info(f"🔧 TOOL PROCESSING: search_knowledge_base | Action: No results found in Bedrock, falling back")
+            tools_logger.debug("🔧 TOOL PROCESSING: search_knowledge_base | Action: No results found in Bedrock, falling back")
             return search_local_knowledge_base(query)
         
         # Formatear resultados de Bedrock
-        formatted_results = []
         total_results = len(results['results'])
+        formatted_response = _format_kb_results(query, results['results'])
         
-        # Tomar los mejores resultados (máximo 3 para no sobrecargar)
-        top_results = results['results'][:3]
-        
-        tools_logger.info(f"🔧 TOOL PROCESSING: search_knowledge_base | Action: Formatting {len(top_results)} top results from {total_results} total")
+        # Solo se cachean respuestas reales de Bedrock, nunca el fallback local
+        _kb_cache.set(cache_key, formatted_response)
+        await _kb_semantic_store(query, max_results, min_score, results['results'])
         
-        for i, result in enumerate(top_results, 1):
-            score = result['score']
-            content = result['content']
-            
-            # Limitar longitud del contenido
-            content_preview = content[:800] + "..." if len(content) > 800 else content
-            
-            formatted_results.append(
-                f"📄 **Resultado {i}** (relevancia: {score:.2f})\n{content_preview}"
-            )
-        
-        formatted_response = f"🔍 **Información encontrada en la base de conocimientos:**\n\n"
-        formatted_response += f"📊 **{total_results} resultados** para: \"{query}\"\n\n"
-        formatted_response += "\n\n".join(formatted_results)
-        
-        if total_results > 3:
-            formatted_response += f"\n\n💡 *Se encontraron {total_results - 3} resultados adicionales. Puedes hacer una consulta más específica para obtener información más precisa.*"
-        
-        tools_logger.info(f"🔧 TOOL OUTPUT: search_knowledge_base | Result: Found {total_results} results from Bedrock | Response length: {len(formatted_response)} chars")
+        tools_logger.info("🔧 TOOL OUTPUT: search_knowledge_base | Result: Found %s results from Bedrock | Response length: %d chars", total_results, len(formatted_response))
         return formatted_response
         
     except Exception as e:
-        tools_logger.error(f"🔧 TOOL ERROR: search_knowledge_base | Exception: {e}")
-        tools_logger.info(f"🔧 TOOL PROCESSING: search_knowledge_base | Action: Falling back to local knowledge base due to exception")
+        tools_logger.error("🔧 TOOL ERROR: search_knowledge_base | Exception: %s", e)
+        tools_logger.debug("🔧 TOOL PROCESSING: search_knowledge_base | Action: Falling back to local knowledge base due to exception")
         return search_local_knowledge_base(query)
 
+# Respuesta de una consulta del lote cuyos resultados ya aparecieron en otra consulta
+_BATCH_DUPLICATE_RESULTS_NOTE = "📄 Los resultados de esta consulta coinciden con los de otra consulta de este lote."
+
+def _content_digest(content: str) -> bytes:
+    """Huella del contenido de un fragmento para detectar duplicados entre consultas."""
+    return hashlib.blake2b(" ".join(content.split()).encode(), digest_size=16).digest()
+
 @tool
-def escalate_to_human(reason: str, customer_info: str = "") -> str:
+async def search_knowledge_base_batch(queries: List[str], max_results: int = 10, min_score: float = 0.1) -> str:
     """
-    Escala la conversación a un agente humano.
+    Busca varias consultas en la base de conocimientos de AWS Bedrock en una sola llamada.
+    
+    Usar cuando la pregunta del cliente tiene varias partes independientes
+    (por ejemplo: política de devoluciones y tiempos de envío).
     
     Args:
-        reason: Motivo de la escalación
-        customer_info: Información adicional del cliente
+        queries: Lista de consultas de búsqueda
+        max_results: Número máximo de resultados por consulta
+        min_score: Puntuación mínima de relevancia
         
     Returns:
-        str: Confirmación de escalación
+        str: Resultados de cada consulta, identificados por su índice
     """
-    tools_logger.info(f"🔧 TOOL INPUT: escalate_to_human | Params: reason='{reason}', customer_info='{customer_info[:100]}...' ")
+    tools_logger.debug("🔧 TOOL INPUT: search_knowledge_base_batch | Params: %d queries, max_results=%s, min_score=%s", len(queries), max_results, min_score)
     
-    escalation_id = datetime.now().strftime("%Y%m%d%H%M%S")
+    # Resultados indexados por posición (tolera consultas duplicadas)
+    responses: Dict[int, str] = {}
+    # Consultas sin caché agrupadas por llave: los duplicados comparten un solo retrieve
+    pending: Dict[bytes, List[int]] = {}
+    for i, query in enumerate(queries):
+        cache_key = _kb_cache_key(query, max_results, min_score)
+        cached_response = _kb_cache.get(cache_key)
+        if cached_response is None and cache_key not in pending:
+            cached_results = await _kb_semantic_lookup(query, max_results, min_score)
+            if cached_results is not None:
+                cached_response = _format_kb_results(query, cached_results, "search_knowledge_base_batch")
+                _kb_cache.set(cache_key, cached_response)
+        if cached_response is not None:
+            responses[i] = cached_response
+        else:
+            pending.setdefault(cache_key, []).append(i)
     
-    tools_logger.info(f"🔧 TOOL PROCESSING: escalate_to_human | Action: Creating escalation with ID {escalation_id}")
+    if pending:
+        tools_logger.debug("🔧 TOOL PROCESSING: search_knowledge_base_batch | Action: Retrieving %d unique queries concurrently (%d cache hits)", len(pending), len(responses))
+        pending_queries = [queries[indexes[0]] for indexes in pending.values()]
+        try:
+            batch_results = await get_bedrock_client().aretrieve_many(pending_queries, max_results, min_score, _RETRIEVE_CONTENT_LIMIT)
+        except Exception as e:
+            tools_logger.error("🔧 TOOL ERROR: search_knowledge_base_batch | Exception: %s", e)
+            batch_results = [{'results': [], 'error': str(e)}] * len(pending)
+        
+        # Fragmentos ya mostrados por otra consulta del lote no se repiten (menos tokens de entrada)
+        shown_contents = set()
+        for (cache_key, indexes), query, results in zip(pending.items(), pending_queries, batch_results):
+            if results.get('error') or not results['results']:
+                response = search_local_knowledge_base(query)
+            else:
+                kb_results = results['results']
+                # La caché guarda la respuesta completa: puede reutilizarse fuera de este lote
+                response = _format_kb_results(query, kb_results, "search_knowledge_base_batch")
+                _kb_cache.set(cache_key, response)
+                await _kb_semantic_store(query, max_results, min_score, kb_results)
+                
+                unique_results = [result for result in kb_results if _content_digest(result['content']) not in shown_contents]
+                if not unique_results:
+                    response = _BATCH_DUPLICATE_RESULTS_NOTE
+                elif len(unique_results) < len(kb_results):
+                    response = _format_kb_results(query, unique_results, "search_knowledge_base_batch")
+                shown_contents.update(_content_digest(result['content']) for result in unique_results[:3])
+            for i in indexes:
+                responses[i] = response
     
-    # En producción, esto activaría el sistema de routing humano
-    # Aquí se haría la llamada al sistema de tickets/escalación
-    tools_logger.info(f"🔧 TOOL PROCESSING: escalate_to_human | Action: Would trigger human routing system (simulated)")
+    formatted_response = "\n\n---\n\n".join(
+        f"🔎 **Consulta {i + 1}**: {queries[i]}\n\n{responses[i]}" for i in range(len(queries))
+    )
     
-    escalation_response = f"""🚀 **Escalando a agente humano**
+    tools_logger.info("🔧 TOOL OUTPUT: search_knowledge_base_batch | Result: %d queries answered | Response length: %d chars", len(queries), len(formatted_response))
+    return formatted_response
+
+# Plantilla de confirmación de escalación (solo se sustituyen el ID y el motivo)
+_ESCALATION_TEMPLATE = """🚀 **Escalando a agente humano**
 
     🆔 **ID de Escalación**: {escalation_id}
     📝 **Motivo**: {reason}
@@ -372,8 +887,34 @@ def escalate_to_human(reason: str, customer_info: str = "") -> str:
     - Si necesitas cerrar, puedes retomar la conversación citando el ID: {escalation_id}
 
     🎧 También puedes llamar directamente al +1-234-567-8900"""
+
+@tool
+async def escalate_to_human(reason: str, customer_info: str = "") -> str:
+    """
+    Escala la conversación a un agente humano.
     
-    tools_logger.info(f"🔧 TOOL OUTPUT: escalate_to_human | Result: Escalation created with ID {escalation_id} | Response length: {len(escalation_response)} chars")
+    Args:
+        reason: Motivo de la escalación
+        customer_info: Información adicional del cliente
+        
+    Returns:
+        str: Confirmación de escalación
+    """
+    if tools_logger.isEnabledFor(logging.DEBUG):
+        tools_logger.debug("🔧 TOOL INPUT: escalate_to_human | Params: reason='%s', customer_info='%s...' ", reason, customer_info[:100])
+    
+    # Sufijo aleatorio: dos escalaciones en el mismo segundo no comparten ID
+    escalation_id = f"{time.strftime('%Y%m%d%H%M%S')}-{secrets.token_hex(2)}"
+    
+    tools_logger.debug("🔧 TOOL PROCESSING: escalate_to_human | Action: Creating escalation with ID %s", escalation_id)
+    
+    # En producción, esto activaría el sistema de routing humano
+    # Aquí se haría la llamada al sistema de tickets/escalación
+    tools_logger.debug("🔧 TOOL PROCESSING: escalate_to_human | Action: Would trigger human routing system (simulated)")
+    
+    escalation_response = _ESCALATION_TEMPLATE.format(escalation_id=escalation_id, reason=reason)
+    
+    tools_logger.info("🔧 TOOL OUTPUT: escalate_to_human | Result: Escalation created with ID %s | Response length: %d chars", escalation_id, len(escalation_response))
     
     return escalation_response
 
@@ -404,7 +945,7 @@ def escalate_to_human(reason: str, customer_info: str = "") -> str:
 #     config = search_configs[search_type]
     
 #     try:
-#         results = bedrock_client.retrieve(
+#         results = get_bedrock_client().retrieve(
 #             query, 
 #             max_results=config["max_results"], 
 #             min_score=config["min_score"]
@@ -472,8 +1013,104 @@ def escalate_to_human(reason: str, customer_info: str = "") -> str:
 # AGENTES ESPECIALIZADOS
 # ==========================================
 
+# Prompt del sistema del knowledge_assistant. Debe mantenerse estático: cualquier
+# dato dinámico va en el mensaje del usuario para no invalidar el prompt caching
+# cleandoc quita la sangría del código fuente (tokens que el modelo no necesita)
+KNOWLEDGE_SYSTEM_PROMPT = inspect.cleandoc("""Eres un asistente de conocimiento especializado en información de la empresa.
+            Tu trabajo es responder preguntas frecuentes usando la información de la base de conocimientos.
+            
+            Pautas:
+            - Prioriza usar search_knowledge_base que conecta con AWS Bedrock Knowledge Base
+            - Si la consulta tiene varias partes independientes, usa search_knowledge_base_batch con todas las búsquedas en una sola llamada
+            - Sé claro y conciso en tus respuestas
+            - Usa emojis para mejorar la legibilidad
+            - Si no tienes la información exacta, sugiere contactar soporte
+            - Siempre mantén un tono amigable y profesional
+            
+            Herramientas disponibles:
+            - search_knowledge_base: Búsqueda principal en Bedrock KB
+            - search_knowledge_base_batch: Varias búsquedas en Bedrock KB en paralelo
+            - get_current_time: Obtener fecha/hora actual""")
+
+# Caché exacta de respuestas del knowledge_assistant por consulta normalizada
+_knowledge_cache = TTLCache(maxsize=KNOWLEDGE_CACHE_CONFIG["maxsize"], ttl=KNOWLEDGE_CACHE_CONFIG["ttl"])
+
+# Caché semántica para consultas parafraseadas (opcional)
+_knowledge_semantic_cache = SemanticCache(
+    threshold=SEMANTIC_CACHE_CONFIG["threshold"],
+    model_name=SEMANTIC_CACHE_CONFIG["model_name"],
+    maxsize=SEMANTIC_CACHE_CONFIG["maxsize"],
+    ttl=SEMANTIC_CACHE_CONFIG["ttl"],
+    index_path=SEMANTIC_CACHE_CONFIG["index_path"],
+    enabled=SEMANTIC_CACHE_CONFIG["enabled"]
+)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+# Marcas diacríticas que deja NFKD ("cómo" -> "co" + U+0301 + "mo"); la tilde de la ñ
+# (U+0303) se conserva y se recompone con NFC para no confundir "año" con "ano"
+_COMBINING_MARKS_RE = re.compile(r"[\u0300-\u0302\u0304-\u036f]+")
+# Dígitos o emails indican datos específicos del usuario: no se comparten entre usuarios
+_USER_SPECIFIC_RE = re.compile(r"\d|[\w.+-]+@[\w-]+\.[\w.-]+")
+# Herramientas cuyo resultado depende del momento: la respuesta no se cachea
+_UNCACHEABLE_TOOLS = frozenset({"get_current_time"})
+
+def _knowledge_cache_key(query: str) -> Optional[str]:
+    """Normaliza la consulta para la caché; retorna None si no debe cachearse."""
+    lowered_query = query.lower()
+    # Se revisa antes de quitar la puntuación para reconocer los emails
+    if _USER_SPECIFIC_RE.search(lowered_query):
+        return None
+    # Sin acentos: "cómo" y "como" comparten la misma entrada
+    unaccented_query = unicodedata.normalize("NFC", _COMBINING_MARKS_RE.sub("", unicodedata.normalize("NFKD", lowered_query)))
+    normalized_query = _WHITESPACE_RE.sub(" ", _PUNCTUATION_RE.sub(" ", unaccented_query)).strip()
+    if len(normalized_query) < KNOWLEDGE_CACHE_CONFIG["min_query_length"]:
+        return None
+    return normalized_query
+
+# Agentes de conocimiento reutilizables: se construyen una vez y se reciclan entre llamadas.
+# Un Agent de Strands no admite invocaciones concurrentes, así que cada llamada toma uno libre.
+# Tras una ráfaga solo se conservan hasta KNOWLEDGE_AGENT_POOL_SIZE agentes inactivos.
+KNOWLEDGE_AGENT_POOL_SIZE = 8
+_knowledge_agent_pool: "queue.Queue[Agent]" = queue.Queue(maxsize=KNOWLEDGE_AGENT_POOL_SIZE)
+
+def _build_knowledge_agent() -> Agent:
+    """Construye un agente de conocimiento (modelo compartido, prompt y herramientas estáticas)."""
+    knowledge_logger.debug("🤖 AGENT PROCESSING: knowledge_assistant | Decision: Creating specialized knowledge agent")
+    return Agent(
+        model=create_model_openai(),
+        system_prompt=KNOWLEDGE_SYSTEM_PROMPT,
+        tools=[search_knowledge_base, search_knowledge_base_batch, get_current_time],
+        conversation_manager=SlidingWindowConversationManager(),
+        # La respuesta se devuelve al orchestrator; no se imprime a stdout
+        callback_handler=None
+    )
+
+def _acquire_knowledge_agent() -> Agent:
+    """Toma un agente libre del pool o crea uno nuevo si todos están ocupados."""
+    try:
+        return _knowledge_agent_pool.get_nowait()
+    except queue.Empty:
+        return _build_knowledge_agent()
+
+def _release_agent(agent: Agent, pool: "queue.Queue[Agent]") -> None:
+    """Limpia el estado de la conversación anterior y devuelve el agente a `pool` (si hay espacio)."""
+    agent.messages.clear()
+    agent.state = AgentState()
+    agent.conversation_manager = SlidingWindowConversationManager()
+    agent.event_loop_metrics = EventLoopMetrics()
+    try:
+        pool.put_nowait(agent)
+    except queue.Full:
+        # Pool lleno: el agente se descarta
+        pass
+
+def _release_knowledge_agent(agent: Agent) -> None:
+    """Devuelve un agente de conocimiento limpio al pool."""
+    _release_agent(agent, _knowledge_agent_pool)
+
 @tool
-def knowledge_assistant(query: str) -> str:
+async def knowledge_assistant(query: str) -> str:
     """
     Asistente especializado en consultas generales y FAQ.
     
@@ -483,40 +1120,65 @@ def knowledge_assistant(query: str) -> str:
     Returns:
         str: Respuesta basada en la base de conocimientos
     """
-    knowledge_logger.info(f"🤖 AGENT INPUT: knowledge_assistant | Message: '{query}'")
+    knowledge_logger.info("🤖 AGENT INPUT: knowledge_assistant | Message: '%s'", query)
+    
+    cache_key = _knowledge_cache_key(query)
+    if cache_key is not None:
+        cached_response = _knowledge_cache.get(cache_key)
+        if cached_response is not None:
+            knowledge_logger.info("🤖 AGENT OUTPUT: knowledge_assistant | Response: Cache hit | Length=%d chars", len(cached_response))
+            return cached_response
+        
+        # Segundo nivel: consultas parafraseadas (el embedding no bloquea el event loop)
+        cached_response = await asyncio.to_thread(_knowledge_semantic_cache.get, cache_key)
+        if cached_response is not None:
+            knowledge_logger.info("🤖 AGENT OUTPUT: knowledge_assistant | Response: Semantic cache hit | Length=%d chars", len(cached_response))
+            _knowledge_cache.set(cache_key, cached_response)
+            return cached_response
     
     try:
-        knowledge_logger.info(f"🤖 AGENT PROCESSING: knowledge_assistant | Decision: Creating specialized knowledge agent")
+        knowledge_logger.debug("🤖 AGENT PROCESSING: knowledge_assistant | Decision: Executing query with knowledge base tools")
         
-        agent = Agent(
-            model=create_model_openai(),
-            system_prompt="""Eres un asistente de conocimiento especializado en información de la empresa.
-            Tu trabajo es responder preguntas frecuentes usando la información de la base de conocimientos.
-            
-            Pautas:
-            - Prioriza usar search_knowledge_base que conecta con AWS Bedrock Knowledge Base
-            - Sé claro y conciso en tus respuestas
-            - Usa emojis para mejorar la legibilidad
-            - Si no tienes la información exacta, sugiere contactar soporte
-            - Siempre mantén un tono amigable y profesional
-            
-            Herramientas disponibles:
-            - search_knowledge_base: Búsqueda principal en Bedrock KB
-            - get_current_time: Obtener fecha/hora actual""",
-            tools=[search_knowledge_base, get_current_time]
-        )
+        # Traza propia para saber si esta respuesta usó el fallback local
+        kb_trace = KnowledgeBaseTrace()
+        trace_token = _kb_trace.set(kb_trace)
+        agent = _acquire_knowledge_agent()
+        try:
+            response = await agent.invoke_async(f"Responde esta consulta usando la base de conocimientos: {query}")
+        finally:
+            _release_knowledge_agent(agent)
+            _kb_trace.reset(trace_token)
+            parent_trace = _kb_trace.get()
+            if parent_trace is not None:
+                parent_trace.merge(kb_trace)
         
-        knowledge_logger.info(f"🤖 AGENT PROCESSING: knowledge_assistant | Decision: Executing query with knowledge base tools")
+        # Una sola conversión del AgentResult a texto
+        text = str(response)
         
-        response = agent(f"Responde esta consulta usando la base de conocimientos: {query}")
+        # No se cachean respuestas con datos del momento ni construidas desde el fallback local
+        tools_used = getattr(response.metrics, 'tool_metrics', None) or {}
+        if cache_key is not None and (kb_trace.local_fallbacks or _UNCACHEABLE_TOOLS.intersection(tools_used)):
+            knowledge_logger.debug("🤖 AGENT PROCESSING: knowledge_assistant | Decision: Response not cached (time-dependent or local fallback)")
+            cache_key = None
+            if _UNCACHEABLE_TOOLS.intersection(tools_used) and parent_trace is not None:
+                parent_trace.uncacheable = True
         
-        knowledge_logger.info(f"🤖 AGENT OUTPUT: knowledge_assistant | Response: Length={len(str(response))} chars, Preview='{str(response)[:100]}...'")
-        return str(response)
+        if cache_key is not None:
+            _knowledge_cache.set(cache_key, text)
+            await asyncio.to_thread(_knowledge_semantic_cache.set, cache_key, text)
+        
+        if knowledge_logger.isEnabledFor(logging.INFO):
+            knowledge_logger.info("🤖 AGENT OUTPUT: knowledge_assistant | Response: Length=%d chars, Preview='%s...'", len(text), text[:100])
+        return text
         
     except Exception as e:
-        knowledge_logger.error(f"🤖 AGENT ERROR: knowledge_assistant | Exception: {e}")
+        knowledge_logger.error("🤖 AGENT ERROR: knowledge_assistant | Exception: %s", e)
+        # La respuesta de error no debe quedar cacheada por el orchestrator
+        parent_trace = _kb_trace.get()
+        if parent_trace is not None:
+            parent_trace.uncacheable = True
         error_response = f"❌ Error al procesar tu consulta. Por favor contacta a soporte: {str(e)}"
-        knowledge_logger.info(f"🤖 AGENT OUTPUT: knowledge_assistant | Response: Error response due to exception")
+        knowledge_logger.info("🤖 AGENT OUTPUT: knowledge_assistant | Response: Error response due to exception")
         return error_response
 
 
@@ -524,18 +1186,8 @@ def knowledge_assistant(query: str) -> str:
 # AGENTE PRINCIPAL (ORCHESTRATOR)
 # ==========================================
 
-class CustomerServiceOrchestrator:
-    """Agente principal que coordina todos los asistentes especializados con AgentCore Memory."""
-    
-    def __init__(self, context: Optional['RequestContext'] = None):
-        self.model = create_model_openai()
-        self.context = context
-        self.session_id = context.session_id if context else None
-        
-        memory_logger.info(f"🧠 ORCHESTRATOR INIT: Session {self.session_id}")
-        
-        # Prompt del sistema optimizado para servicio al cliente con Bedrock
-        self.system_prompt = """🤖 **Eres el Agente Principal de Servicio al Cliente con AWS Bedrock Knowledge Base**
+# Prompt del sistema del orchestrator (estático, compartido entre sesiones para el prompt caching)
+ORCHESTRATOR_SYSTEM_PROMPT = inspect.cleandoc("""🤖 **Eres el Agente Principal de Servicio al Cliente con AWS Bedrock Knowledge Base**
 
                             Tu misión es proporcionar un servicio excepcional coordinando con asistentes especializados y accediendo a información actualizada desde AWS Bedrock.
 
@@ -574,20 +1226,214 @@ class CustomerServiceOrchestrator:
                             - Si no te sabes la respuesta, no inventes información.
                             - Si la informacion no esta disponible, menciona que no tienes la informacion y que no sabes la respuesta.
 
-                            Comienza cada conversación con una presentación amigable y pregunta específica sobre cómo puedes ayudar."""
+                            Comienza cada conversación con una presentación amigable y pregunta específica sobre cómo puedes ayudar.""")
 
-        # Crear el agente principal
-        self.orchestrator = Agent(
-            model=self.model,
-            system_prompt=self.system_prompt,
-            tools=[
-                knowledge_assistant,
-                escalate_to_human,
-                get_current_time,
-            ]
+@dataclass
+class ChatResult:
+    """Respuesta del orchestrator junto con la traza de herramientas realmente invocadas."""
+    
+    text: str
+    tools_used: List[str] = field(default_factory=list)
+    agents_involved: List[str] = field(default_factory=lambda: ["orchestrator"])
+    bedrock_query_count: int = 0  # Retrieve reales a Bedrock (sin hits de caché)
+    
+    def __str__(self) -> str:
+        return self.text
+    
+    @classmethod
+    def from_agent_result(cls, response: Any, text: Optional[str] = None,
+                          tool_calls_before: Optional[Dict[str, int]] = None,
+                          bedrock_query_count: int = 0) -> "ChatResult":
+        """
+        Construye el resultado a partir de las métricas de herramientas del AgentResult de Strands.
+        
+        Las métricas de Strands son acumuladas durante la vida del Agent, por lo que
+        solo se reportan las herramientas cuyo contador creció respecto a
+        `tool_calls_before` (snapshot tomado antes de la invocación).
+        
+        Args:
+            response: AgentResult de la invocación
+            text: Texto ya convertido de la respuesta (evita otra conversión)
+            tool_calls_before: Llamadas por herramienta antes de esta invocación
+            bedrock_query_count: Consultas reales a Bedrock durante esta invocación
+        """
+        metrics = getattr(response, 'metrics', None)
+        tool_metrics = getattr(metrics, 'tool_metrics', None) or {}
+        tool_calls_before = tool_calls_before or {}
+        
+        tools_used = [
+            name for name, tool_metric in tool_metrics.items()
+            if getattr(tool_metric, 'call_count', 0) > tool_calls_before.get(name, 0)
+        ]
+        agents_involved = ["orchestrator"]
+        if "knowledge_assistant" in tools_used:
+            agents_involved.append("knowledge_assistant")
+        
+        return cls(
+            text=str(response) if text is None else text,
+            tools_used=tools_used,
+            agents_involved=agents_involved,
+            bedrock_query_count=bedrock_query_count
+        )
+
+# Respuesta al cliente cuando falla el procesamiento de un mensaje
+_CHAT_ERROR_TEMPLATE = """❌ **Error del sistema**
+
+            Disculpa, he encontrado un problema técnico. 
+
+            🔧 **Opciones disponibles:**
+            1. Intenta reformular tu consulta
+            2. Contacta directamente: +1-234-567-8900
+            3. Email: soporte@empresa.com
+
+            **Error**: {error}"""
+
+@contextmanager
+def _track_knowledge_base() -> Iterator[KnowledgeBaseTrace]:
+    """Fija una traza nueva de uso de la Knowledge Base para la invocación en curso."""
+    kb_trace = KnowledgeBaseTrace()
+    token = _kb_trace.set(kb_trace)
+    try:
+        yield kb_trace
+    finally:
+        _kb_trace.reset(token)
+
+# Tope de seguridad del historial: 10 turnos (usuario + agente)
+_MAX_HISTORY_MESSAGES = 20
+# Presupuesto de tokens de entrada para el historial; se estima con ~4 caracteres por token
+# (sin tokenizador extra) para que respuestas largas no disparen el costo por turno
+_HISTORY_TOKEN_BUDGET = 2000
+_CHARS_PER_TOKEN = 4
+
+def _trim_history_to_budget(history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    Conserva los mensajes más recientes que caben en _HISTORY_TOKEN_BUDGET.
+    
+    Se descartan los más antiguos (el resto del prefijo no cambia) y el historial
+    resultante siempre empieza con un turno del usuario.
+    """
+    char_budget = _HISTORY_TOKEN_BUDGET * _CHARS_PER_TOKEN
+    start = len(history)
+    used_chars = 0
+    while start > 0:
+        used_chars += len(history[start - 1].get("content") or "")
+        if used_chars > char_budget:
+            break
+        start -= 1
+    
+    while start < len(history) and history[start].get("role") != "user":
+        start += 1
+    return history[start:] if start else history
+
+def _normalize_history(history: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Convierte entradas del formato anterior ({user_message, agent_response}) al
+    formato canónico role/content, reconstruyendo el turno tal como se envió al modelo.
+    """
+    if all('role' in item for item in history):
+        return history
+    
+    normalized = []
+    for item in history:
+        if 'role' in item:
+            normalized.append(item)
+            continue
+        user_id = item.get('user_id')
+        user_message = item.get('user_message', '')
+        normalized.append({"role": "user", "content": f"Usuario {user_id}: {user_message}" if user_id else user_message})
+        normalized.append({"role": "assistant", "content": item.get('agent_response', '')})
+    return normalized[-_MAX_HISTORY_MESSAGES:]
+
+# Último historial escrito por sesión (write-through): el siguiente turno no lo relee del backend.
+# Las listas cacheadas no se modifican; cada escritura guarda una lista nueva.
+# La caché es por proceso: solo se usa con backends append-only, donde cada escritura añade
+# el turno nuevo en el backend. Con un historial desactualizado (p. ej. otro worker escribió
+# turnos de la sesión) el contexto del modelo queda incompleto, pero nunca se reescribe la
+# lista del backend a partir de él, así que no se pierden turnos
+_history_cache = TTLCache(maxsize=HISTORY_CACHE_CONFIG["maxsize"], ttl=HISTORY_CACHE_CONFIG["ttl"])
+
+# Escritura de memoria en curso por sesión (también mantiene viva la tarea hasta que termina)
+_pending_memory_writes: Dict[str, "asyncio.Task[None]"] = {}
+
+def _forget_memory_write(session_id: str, write: "asyncio.Task[None]") -> None:
+    """Descarta la escritura terminada, salvo que ya la haya reemplazado una más reciente."""
+    if _pending_memory_writes.get(session_id) is write:
+        del _pending_memory_writes[session_id]
+
+# Agentes del orchestrator reutilizables entre sesiones: el modelo, el prompt y las herramientas
+# son compartidos; lo único propio de cada sesión (sus mensajes) se siembra en cada petición
+ORCHESTRATOR_AGENT_POOL_SIZE = 8
+_orchestrator_agent_pool: "queue.Queue[Agent]" = queue.Queue(maxsize=ORCHESTRATOR_AGENT_POOL_SIZE)
+
+def _build_orchestrator_agent() -> Agent:
+    """Construye el agente principal (modelo compartido, prompt y herramientas estáticas)."""
+    return Agent(
+        model=create_model_openai(),
+        system_prompt=ORCHESTRATOR_SYSTEM_PROMPT,
+        tools=[
+            knowledge_assistant,
+            escalate_to_human,
+            get_current_time,
+        ],
+        # La salida se entrega con chat_stream(); sin impresión duplicada a stdout
+        callback_handler=None
+    )
+
+# Respuestas completas del primer turno por (usuario, consulta normalizada): una pregunta
+# frecuente repetida se responde sin invocar al modelo. El espacio por usuario evita que
+# una respuesta personalizada llegue a otro cliente.
+_response_cache = TTLCache(maxsize=RESPONSE_CACHE_CONFIG["maxsize"], ttl=RESPONSE_CACHE_CONFIG["ttl"])
+# Además de las herramientas dependientes del momento, una escalación genera un ticket único
+_UNCACHEABLE_RESPONSE_TOOLS = _UNCACHEABLE_TOOLS | {"escalate_to_human"}
+
+def _acquire_orchestrator_agent() -> Agent:
+    """Toma un agente principal libre del pool o crea uno nuevo si no hay."""
+    try:
+        return _orchestrator_agent_pool.get_nowait()
+    except queue.Empty:
+        return _build_orchestrator_agent()
+
+class CustomerServiceOrchestrator:
+    """Agente principal que coordina todos los asistentes especializados con AgentCore Memory."""
+    
+    def __init__(self, context: Optional['RequestContext'] = None):
+        self.model = create_model_openai()
+        self.context = context
+        self.session_id = context.session_id if context else None
+        
+        # Sin memoria de AgentCore (p. ej. pruebas locales) el historial vive en proceso
+        # Se resuelve una sola vez; los métodos de memoria solo comparan contra None
+        self._memory = getattr(context, 'memory', None) if context else None
+        self._memory_append = getattr(self._memory, 'append', None)
+        self._memory_ltrim = getattr(self._memory, 'ltrim', None)
+        # Solo el backend append-only admite el historial cacheado (ver _history_cache)
+        self._history_cache_enabled = (
+            self.session_id is not None
+            and self._memory_append is not None
+            and self._memory_ltrim is not None
         )
+        self._local_history: List[Dict[str, str]] = []
+        
+        memory_logger.info("🧠 ORCHESTRATOR INIT: Session %s", self.session_id)
+        memory_logger.debug("🧠 ORCHESTRATOR INIT: AgentCore memory available: %s", self._memory is not None)
+        
+        # Prompt del sistema estático (prefijo idéntico en cada turno para el prompt caching)
+        self.system_prompt = ORCHESTRATOR_SYSTEM_PROMPT
+
+        # Agente principal tomado del pool; close() lo devuelve limpio
+        self.orchestrator = _acquire_orchestrator_agent()
     
-    def chat(self, message: str, user_id: str = None) -> str:
+    def close(self) -> None:
+        """
+        Devuelve el agente principal al pool para que otra sesión lo reutilice.
+        
+        Después de close() el orchestrator ya no debe usarse. Llamarlo más de una vez no tiene efecto.
+        """
+        agent, self.orchestrator = self.orchestrator, None
+        if agent is not None:
+            _release_agent(agent, _orchestrator_agent_pool)
+    
+    def chat(self, message: str, user_id: str = None) -> ChatResult:
         """
         Procesa un mensaje del cliente y retorna la respuesta apropiada usando AgentCore Memory.
         
@@ -596,134 +1442,320 @@ class CustomerServiceOrchestrator:
             user_id: ID del usuario para contexto personalizado
             
         Returns:
-            str: Respuesta del agente de servicio al cliente
+            ChatResult: Respuesta del agente y herramientas utilizadas
         """
-        orchestrator_logger.info(f"🎯 ORCHESTRATOR INPUT: '{message}' | User: {user_id} | Session: {self.session_id}")
+        orchestrator_logger.info("🎯 ORCHESTRATOR INPUT: '%s' | User: %s | Session: %s", message, user_id, self.session_id)
         
         try:
-            # Recuperar historial de conversación si existe
             conversation_history = self._get_conversation_history()
+            contextualized_message, ready_result, cache_key = self._prepare_turn(message, user_id, conversation_history)
+            if ready_result is not None:
+                self._save_interaction(contextualized_message, ready_result.text, user_id, conversation_history)
+                return ready_result
             
-            # Construir contexto completo del mensaje
-            contextualized_message = self._build_contextualized_message(message, user_id, conversation_history)
+            # Procesar mensaje con el orchestrator contando solo las consultas de este turno
+            tool_calls_before = self._tool_call_counts()
+            with _track_knowledge_base() as kb_trace:
+                response = self.orchestrator(contextualized_message)
             
-            # Procesar mensaje con el orchestrator
-            response = self.orchestrator(contextualized_message)
+            # Una sola conversión del AgentResult a texto
+            text = str(response)
             
             # Guardar interacción en memoria
-            self._save_interaction(message, str(response), user_id)
+            self._save_interaction(contextualized_message, text, user_id, conversation_history)
             
-            orchestrator_logger.info(f"🎯 ORCHESTRATOR OUTPUT: Length: {len(str(response))} chars | Preview: {str(response)[:100]}...")
-            return str(response)
+            if orchestrator_logger.isEnabledFor(logging.INFO):
+                orchestrator_logger.info("🎯 ORCHESTRATOR OUTPUT: Length: %d chars | Preview: %s...", len(text), text[:100])
+            result = ChatResult.from_agent_result(response, text, tool_calls_before, kb_trace.bedrock_queries)
+            self._cache_response(cache_key, result, kb_trace)
+            return result
             
         except Exception as e:
-            logger.error(f"Error en chat: {e}")
-            error_response = f"""❌ **Error del sistema**
-
-            Disculpa, he encontrado un problema técnico. 
-
-            🔧 **Opciones disponibles:**
-            1. Intenta reformular tu consulta
-            2. Contacta directamente: +1-234-567-8900
-            3. Email: soporte@empresa.com
-
-            **Error**: {str(e)}"""
-            return error_response
+            logger.error("Error en chat: %s", e)
+            return ChatResult(text=_CHAT_ERROR_TEMPLATE.format(error=e))
+    
+    async def achat(self, message: str, user_id: str = None) -> ChatResult:
+        """
+        Versión asíncrona de chat() para ejecutarse dentro del event loop de AgentCore.
+        
+        Las operaciones bloqueantes (memoria) se delegan a hilos y la invocación
+        del modelo se espera con invoke_async, de modo que el loop nunca se bloquea.
+        
+        Args:
+            message: Mensaje del cliente
+            user_id: ID del usuario para contexto personalizado
+            
+        Returns:
+            ChatResult: Respuesta del agente y herramientas utilizadas
+        """
+        orchestrator_logger.info("🎯 ORCHESTRATOR INPUT (async): '%s' | User: %s | Session: %s", message, user_id, self.session_id)
+        
+        try:
+            conversation_history = await self._aget_conversation_history()
+            contextualized_message, ready_result, cache_key = self._prepare_turn(message, user_id, conversation_history)
+            if ready_result is not None:
+                await self._asave_interaction(contextualized_message, ready_result.text, user_id, conversation_history)
+                return ready_result
+            
+            # Procesar mensaje con el orchestrator sin bloquear el event loop
+            tool_calls_before = self._tool_call_counts()
+            with _track_knowledge_base() as kb_trace:
+                response = await self.orchestrator.invoke_async(contextualized_message)
+            
+            # Una sola conversión del AgentResult a texto
+            text = str(response)
+            
+            # Guardar interacción en memoria
+            await self._asave_interaction(contextualized_message, text, user_id, conversation_history)
+            
+            if orchestrator_logger.isEnabledFor(logging.INFO):
+                orchestrator_logger.info("🎯 ORCHESTRATOR OUTPUT: Length: %d chars | Preview: %s...", len(text), text[:100])
+            result = ChatResult.from_agent_result(response, text, tool_calls_before, kb_trace.bedrock_queries)
+            self._cache_response(cache_key, result, kb_trace)
+            return result
+            
+        except Exception as e:
+            logger.error("Error en achat: %s", e)
+            return ChatResult(text=_CHAT_ERROR_TEMPLATE.format(error=e))
+    
+    async def chat_stream(self, message: str, user_id: str = None) -> AsyncIterator[str]:
+        """
+        Versión en streaming de achat(): entrega los fragmentos de texto conforme el modelo los genera.
+        
+        La respuesta completa se acumula en un buffer y se guarda en memoria al terminar el stream.
+        
+        Args:
+            message: Mensaje del cliente
+            user_id: ID del usuario para contexto personalizado
+            
+        Yields:
+            str: Fragmentos de texto de la respuesta
+        """
+        orchestrator_logger.info("🎯 ORCHESTRATOR INPUT (stream): '%s' | User: %s | Session: %s", message, user_id, self.session_id)
+        
+        try:
+            conversation_history = await self._aget_conversation_history()
+            contextualized_message, ready_result, cache_key = self._prepare_turn(message, user_id, conversation_history)
+            if ready_result is not None:
+                await self._asave_interaction(contextualized_message, ready_result.text, user_id, conversation_history)
+                yield ready_result.text
+                return
+            
+            buffer = io.StringIO()
+            result = None
+            tool_calls_before = self._tool_call_counts()
+            with _track_knowledge_base() as kb_trace:
+                async for event in self.orchestrator.stream_async(contextualized_message):
+                    if "data" in event:
+                        buffer.write(event["data"])
+                        yield event["data"]
+                    elif "result" in event:
+                        result = event["result"]
+            
+            response_text = str(result) if result is not None else buffer.getvalue()
+            
+            # Guardar interacción en memoria con la respuesta completa
+            await self._asave_interaction(contextualized_message, response_text, user_id, conversation_history)
+            
+            orchestrator_logger.info("🎯 ORCHESTRATOR OUTPUT (stream): Length: %d chars", len(response_text))
+            if result is not None:
+                self._cache_response(cache_key, ChatResult.from_agent_result(result, response_text, tool_calls_before), kb_trace)
+            
+        except Exception as e:
+            logger.error("Error en chat_stream: %s", e)
+            yield _CHAT_ERROR_TEMPLATE.format(error=e)
     
     def _get_conversation_history(self) -> List[Dict[str, Any]]:
         """Recupera el historial de conversación desde AgentCore Memory."""
-        if not self.context or not hasattr(self.context, 'memory'):
-            memory_logger.info("🧠 MEMORY: No context available, starting fresh conversation")
-            return []
+        if self._memory is None:
+            return self._local_history
+        
+        if self._history_cache_enabled:
+            cached_history = _history_cache.get(self.session_id)
+            if cached_history is not None:
+                memory_logger.debug("🧠 MEMORY CACHE: Reusing %d cached messages", len(cached_history))
+                return cached_history
         
         try:
-            history = self.context.memory.get('conversation_history', [])
-            memory_logger.info(f"🧠 MEMORY GET: Retrieved {len(history)} previous interactions")
+            history = _normalize_history(self._memory.get('conversation_history', []))
+            memory_logger.info("🧠 MEMORY GET: Retrieved %d previous interactions", len(history))
             return history
         except Exception as e:
-            memory_logger.error(f"🧠 MEMORY ERROR: Failed to retrieve history - {e}")
+            memory_logger.error("🧠 MEMORY ERROR: Failed to retrieve history - %s", e)
             return []
     
-    def _save_interaction(self, user_message: str, agent_response: str, user_id: str = None):
-        """Guarda la interacción actual en AgentCore Memory."""
-        if not self.context or not hasattr(self.context, 'memory'):
-            memory_logger.warning("🧠 MEMORY: No context available, cannot save interaction")
+    def _save_interaction(self, user_message: str, agent_response: str, user_id: str = None, history: Optional[List[Dict[str, str]]] = None):
+        """
+        Guarda la interacción actual en AgentCore Memory.
+        
+        `user_message` es el texto exacto enviado al modelo, de modo que el historial
+        sembrado en turnos siguientes reproduzca el mismo prefijo.
+        
+        Si el backend de memoria soporta append y ltrim se añade solo el turno nuevo y
+        se recorta en el backend; si no, se reescribe la lista (con el tope aplicado)
+        usando el historial que chat() ya recuperó, sin volver a leerlo.
+        """
+        new_turn = (
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": agent_response},
+        )
+        
+        if self._memory is None:
+            self._local_history.extend(new_turn)
+            if len(self._local_history) > _MAX_HISTORY_MESSAGES:
+                del self._local_history[:len(self._local_history) - _MAX_HISTORY_MESSAGES]
+            self._local_history[:] = _trim_history_to_budget(self._local_history)
             return
         
         try:
-            # Obtener historial actual
-            history = self._get_conversation_history()
-            
-            # Añadir nueva interacción
-            new_interaction = {
-                'timestamp': datetime.now().isoformat(),
-                'user_id': user_id,
-                'user_message': user_message,
-                'agent_response': agent_response,
-                'session_id': self.session_id
-            }
+            if self._memory_append is not None and self._memory_ltrim is not None:
+                # Append-only: una escritura por mensaje y recorte en el backend, sin leer el historial
+                for item in new_turn:
+                    self._memory_append('conversation_history', item)
+                self._memory_ltrim('conversation_history', -_MAX_HISTORY_MESSAGES, -1)
+                memory_logger.info("🧠 MEMORY APPEND: Saved interaction")
+                # Reflejar en la caché el mismo recorte que aplicó el backend
+                if history is not None:
+                    self._cache_history([*history, *new_turn][-_MAX_HISTORY_MESSAGES:])
+                else:
+                    self._cache_history(None)
+                return
+            
+            # Reutilizar el historial ya recuperado en este turno
+            history = list(history) if history is not None else self._get_conversation_history()
             
-            history.append(new_interaction)
+            # Añadir el turno nuevo al final (append-only, sin truncar el contenido)
+            history.extend(new_turn)
             
-            # Limitar historial a las últimas 10 interacciones para evitar overflow
-            if len(history) > 10:
-                history = history[-10:]
+            # Tope de seguridad: al superar 10 turnos o el presupuesto de tokens se descartan los más antiguos
+            if len(history) > _MAX_HISTORY_MESSAGES:
+                del history[:len(history) - _MAX_HISTORY_MESSAGES]
+            history = _trim_history_to_budget(history)
             
-            # Guardar en memoria
-            self.context.memory.set('conversation_history', history)
+            # Guardar en memoria (sin caché: la reescritura parte siempre de una lectura del backend)
+            self._memory.set('conversation_history', history)
             
-            memory_logger.info(f"🧠 MEMORY SET: Saved interaction | Total history: {len(history)} items")
+            memory_logger.info("🧠 MEMORY SET: Saved interaction | Total history: %d items", len(history))
             
         except Exception as e:
-            memory_logger.error(f"🧠 MEMORY ERROR: Failed to save interaction - {e}")
+            memory_logger.error("🧠 MEMORY ERROR: Failed to save interaction - %s", e)
+            # Estado del backend incierto: el siguiente turno lo vuelve a leer
+            self._cache_history(None)
+    
+    def _cache_history(self, history: Optional[List[Dict[str, str]]]) -> None:
+        """Guarda en la caché el historial recién escrito de la sesión, o la invalida con None."""
+        if not self._history_cache_enabled:
+            return
+        if history is None:
+            _history_cache.discard(self.session_id)
+        else:
+            _history_cache.set(self.session_id, history)
+    
+    async def _aget_conversation_history(self) -> List[Dict[str, Any]]:
+        """Versión asíncrona: solo delega a un hilo cuando hay memoria remota."""
+        if self._memory is None:
+            return self._local_history
+        
+        # La escritura del turno anterior de esta sesión debe terminar antes de leer
+        pending_write = _pending_memory_writes.get(self.session_id)
+        if pending_write is not None and pending_write.get_loop() is asyncio.get_running_loop():
+            # shield: cancelar esta petición no debe cancelar la escritura
+            await asyncio.shield(pending_write)
+        return await asyncio.to_thread(self._get_conversation_history)
     
-    def _build_contextualized_message(self, message: str, user_id: str = None, history: List[Dict] = None) -> str:
-        """Construye un mensaje contextualizado con historial de conversación."""
-        if not history:
-            # Primera interacción o sin historial
-            context_prefix = f"Usuario {user_id}: {message}" if user_id else message
-            memory_logger.info("🧠 CONTEXT: First interaction, no previous history")
-            return context_prefix
+    async def _asave_interaction(self, user_message: str, agent_response: str, user_id: str = None, history: Optional[List[Dict[str, str]]] = None):
+        """
+        Versión asíncrona: el historial local se actualiza en el mismo hilo.
+        
+        Con memoria remota la escritura corre en segundo plano: la respuesta no espera
+        al backend y la siguiente lectura de la misma sesión espera a que termine.
+        """
+        if self._memory is None:
+            self._save_interaction(user_message, agent_response, user_id, history)
+            return
         
-        # Construir contexto con historial reciente
-        context_parts = []
+        if self.session_id is None:
+            await asyncio.to_thread(self._save_interaction, user_message, agent_response, user_id, history)
+            return
         
-        # Añadir resumen del historial reciente (hasta 3 interacciones anteriores)
-        recent_history = history[-3:] if len(history) > 3 else history
+        write = asyncio.create_task(
+            asyncio.to_thread(self._save_interaction, user_message, agent_response, user_id, history)
+        )
+        _pending_memory_writes[self.session_id] = write
+        write.add_done_callback(partial(_forget_memory_write, self.session_id))
+    
+    def _seed_messages(self, history: List[Dict[str, str]]) -> None:
+        """Carga el historial canónico (role/content) como mensajes del agente, una sola vez."""
+        if not history or self.orchestrator.messages:
+            return
         
-        if recent_history:
-            context_parts.append("📝 **Contexto de conversación anterior:**")
-            for i, interaction in enumerate(recent_history, 1):
-                context_parts.append(f"Interacción {i}:")
-                context_parts.append(f"Usuario: {interaction.get('user_message', 'N/A')}")
-                context_parts.append(f"Agente: {interaction.get('agent_response', 'N/A')[:100]}...")
-                context_parts.append("")
+        # El backend append-only recorta por número de mensajes; el presupuesto de tokens se aplica aquí
+        self.orchestrator.messages.extend(
+            {"role": item["role"], "content": [{"text": item["content"]}]}
+            for item in _trim_history_to_budget(history)
+            if item.get("role") in ("user", "assistant") and item.get("content")
+        )
+        memory_logger.info("🧠 CONTEXT: Seeded agent with %d previous messages", len(self.orchestrator.messages))
+    
+    def _prepare_turn(self, message: str, user_id: str, history: List[Dict[str, str]]) -> tuple[str, Optional[ChatResult], Optional[tuple]]:
+        """
+        Prepara el turno común a chat(), achat() y chat_stream().
         
-        # Añadir mensaje actual
-        context_parts.append("💬 **Mensaje actual:**")
-        context_parts.append(f"Usuario {user_id}: {message}" if user_id else message)
+        Siembra el historial como mensajes del agente, construye el turno del usuario
+        (solo se añade el turno nuevo; el prefijo de la conversación no cambia) y
+        resuelve sin ida y vuelta al LLM las intenciones triviales y las preguntas
+        ya respondidas al mismo usuario en el primer turno de otra sesión.
         
-        contextualized_message = "\n".join(context_parts)
+        Returns:
+            tuple: (mensaje contextualizado, resultado ya resuelto o None,
+                    clave de la caché de respuestas o None si el turno no es cacheable)
+        """
+        self._seed_messages(history)
+        contextualized_message = self._build_contextualized_message(message, user_id)
         
-        memory_logger.info(f"🧠 CONTEXT: Built contextualized message | History items: {len(recent_history)}")
+        ready_result = None
+        cache_key = None
+        canned_response = route_trivial_intent(message)
+        if canned_response is not None:
+            ready_result = ChatResult(text=canned_response, agents_involved=["router"])
+        elif not self.orchestrator.messages:
+            # Solo el primer turno: con historial la respuesta depende de la conversación previa
+            normalized_message = _knowledge_cache_key(message)
+            if normalized_message is not None:
+                cache_key = (user_id, normalized_message)
+                cached_response = _response_cache.get(cache_key)
+                if cached_response is not None:
+                    orchestrator_logger.info("🎯 ORCHESTRATOR CACHE: Response cache hit | Length=%d chars", len(cached_response))
+                    ready_result = ChatResult(text=cached_response, agents_involved=["cache"])
         
-        return contextualized_message
-
-def main():
-    """Función principal para probar el agente de servicio al cliente."""
+        if ready_result is not None:
+            self._record_turn(contextualized_message, ready_result.text)
+        return contextualized_message, ready_result, cache_key
     
-    print("🤖 " + "="*60)
-    print("   AGENTE DE SERVICIO AL CLIENTE - STRANDS AGENTS")
-    print("="*60)
-    print("💡 Escribe 'exit' para salir del chat")
-    print("💡 Escribe 'help' para ver comandos disponibles")
-    print("-"*60)
+    def _cache_response(self, cache_key: Optional[tuple], result: ChatResult, kb_trace: KnowledgeBaseTrace) -> None:
+        """Guarda la respuesta del turno salvo que dependa del momento, de una escalación o del fallback local."""
+        if cache_key is None or kb_trace.local_fallbacks or kb_trace.uncacheable:
+            return
+        if _UNCACHEABLE_RESPONSE_TOOLS.intersection(result.tools_used):
+            return
+        _response_cache.set(cache_key, result.text)
     
-    # Crear instancia del orchestrator (sin context para testing local)
-    agent = CustomerServiceOrchestrator()
+    def _tool_call_counts(self) -> Dict[str, int]:
+        """Snapshot de las llamadas acumuladas por herramienta del agente principal."""
+        tool_metrics = self.orchestrator.event_loop_metrics.tool_metrics
+        return {name: tool_metric.call_count for name, tool_metric in tool_metrics.items()}
     
-    # Mensaje de bienvenida
-    welcome_message = """¡Hola! 👋 Soy tu asistente de servicio al cliente con acceso a información actualizada.
+    def _record_turn(self, user_message: str, agent_response: str) -> None:
+        """Añade un turno resuelto fuera del LLM a los mensajes del agente para mantener el contexto."""
+        self.orchestrator.messages.append({"role": "user", "content": [{"text": user_message}]})
+        self.orchestrator.messages.append({"role": "assistant", "content": [{"text": agent_response}]})
+    
+    def _build_contextualized_message(self, message: str, user_id: str = None) -> str:
+        """Construye el turno nuevo del usuario; el historial viaja como mensajes del agente."""
+        return f"Usuario {user_id}: {message}" if user_id else message
+
+# Textos estáticos de la interfaz de línea de comandos
+WELCOME_MSG = """¡Hola! 👋 Soy tu asistente de servicio al cliente con acceso a información actualizada.
 
     🎯 **¿En qué puedo ayudarte hoy?**
 
@@ -738,8 +1770,51 @@ def main():
     ✨ **Conectado a AWS Bedrock Knowledge Base** para información más precisa y actualizada.
 
     Solo describe tu consulta y te conectaré con el asistente especializado apropiado."""
+
+HELP_MSG = """
+                🆘 **Comandos disponibles:**
+                - 'exit': Salir del chat
+                - 'help': Mostrar esta ayuda
+                - Cualquier otra consulta será procesada por el agente
+
+                📞 **Contacto directo:**
+                - Teléfono: +1-234-567-8900
+                - Email: soporte@empresa.com
+                """
+
+async def _print_stream(agent: CustomerServiceOrchestrator, message: str, user_id: str = None) -> None:
+    """Imprime en la terminal los fragmentos de la respuesta del agente conforme llegan."""
+    async for chunk in agent.chat_stream(message, user_id):
+        print(chunk, end="", flush=True)
+
+def _warm_up_knowledge_base() -> None:
+    """Crea el cliente de la Knowledge Base por adelantado (se ejecuta mientras el usuario escribe)."""
+    try:
+        get_bedrock_client()
+    except Exception as e:
+        # El error ya se registró al inicializar; la primera búsqueda lo reintenta
+        logger.warning("⚠️ Precarga del cliente Bedrock fallida: %s", e)
+
+def main():
+    """Función principal para probar el agente de servicio al cliente."""
+    
+    print("🤖 " + "="*60)
+    print("   AGENTE DE SERVICIO AL CLIENTE - STRANDS AGENTS")
+    print("="*60)
+    print("💡 Escribe 'exit' para salir del chat")
+    print("💡 Escribe 'help' para ver comandos disponibles")
+    print("-"*60)
+    
+    # Crear instancia del orchestrator (sin context para testing local)
+    agent = CustomerServiceOrchestrator()
+    
+    print(f"\n🤖 {WELCOME_MSG}\n")
+    
+    # La inicialización del cliente de la KB se solapa con la escritura del primer mensaje
+    threading.Thread(target=_warm_up_knowledge_base, name="kb-warm-up", daemon=True).start()
     
-    print(f"\n🤖 {welcome_message}\n")
+    # Un solo event loop para toda la sesión en lugar de uno nuevo por turno
+    runner = asyncio.Runner()
     
     # Loop principal del chat
     while True:
@@ -747,28 +1822,22 @@ def main():
             # Obtener input del usuario
             user_input = input("👤 Tú: ").strip()
             
-            # Comandos especiales
-            if user_input.lower() == 'exit':
+            # Comandos especiales (se normaliza una sola vez por turno)
+            command = user_input.lower()
+            if command == 'exit':
                 print("\n👋 ¡Gracias por usar nuestro servicio! Que tengas un excelente día.")
                 break
-            elif user_input.lower() == 'help':
-                print("""
-                🆘 **Comandos disponibles:**
-                - 'exit': Salir del chat
-                - 'help': Mostrar esta ayuda
-                - Cualquier otra consulta será procesada por el agente
-
-                📞 **Contacto directo:**
-                - Teléfono: +1-234-567-8900
-                - Email: soporte@empresa.com
-                """)
+            elif command == 'help':
+                print(HELP_MSG)
                 continue
             elif not user_input:
                 continue
             
-            # Procesar mensaje con el agente (con user_id de prueba para testing local)
-            response = agent.chat(user_input, user_id="local_test_user")
-            print(f"\n🤖 {response}\n")
+            # Procesar mensaje con el agente mostrando la respuesta conforme se genera
+            # (con user_id de prueba para testing local)
+            print("\n🤖 ", end="", flush=True)
+            runner.run(_print_stream(agent, user_input, user_id="local_test_user"))
+            print("\n")
             
         except KeyboardInterrupt:
             print("\n\n👋 Conversación interrumpida. ¡Hasta la próxima!")
@@ -776,6 +1845,8 @@ def main():
         except Exception as e:
             print(f"\n❌ Error inesperado: {e}")
             print("🔧 Por favor intenta de nuevo o contacta a soporte técnico.\n")
+    
+    runner.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,90 @@
+"""
+Enrutador de intenciones triviales
+==================================
+
+Resuelve de forma determinista los mensajes que no necesitan al LLM
+(saludos, agradecimientos, despedidas, solicitudes de datos de contacto y
+preguntas por la fecha u hora actual) con respuestas predefinidas. Todos los
+patrones están anclados al mensaje completo: cualquier mensaje con contenido
+adicional va al orchestrator.
+"""
+
+import re
+import time
+import logging
+from typing import Optional
+
+orchestrator_logger = logging.getLogger("CustomerService.Orchestrator")
+
+# Mensajes que son únicamente un saludo, agradecimiento o despedida (sin consulta adicional)
+_GREETING_RE = re.compile(r"^[\s¡]*(hola|buen(os|as) (días|tardes|noches)|buenas|hey|qué tal)[\s!¡.,]*$", re.IGNORECASE)
+_THANKS_RE = re.compile(r"^[\s¡]*((muchas )?gracias|mil gracias|te lo agradezco)[\s!¡.,]*$", re.IGNORECASE)
+_FAREWELL_RE = re.compile(r"^[\s¡]*(adiós|adios|hasta luego|nos vemos|bye)[\s!¡.,]*$", re.IGNORECASE)
+# Solo preguntas cortas por los datos de contacto de soporte; frases como
+# "quiero actualizar mi número de contacto" no coinciden y van al orchestrator
+_CONTACT_RE = re.compile(
+    r"^[\s¿¡]*"
+    r"(?:(?:cu[aá]l(?:es)? (?:es|son)|me (?:das|puedes dar|pasas)|dame|tienen|tienes) )?"
+    r"(?:(?:el|los|su|sus|un) )?"
+    r"(?:tel[eé]fono|n[uú]mero(?: de tel[eé]fono)?|email|correo(?: electr[oó]nico)?|datos) "
+    r"de (?:contacto|soporte|atenci[oó]n(?: al cliente)?)"
+    r"(?: de (?:ustedes|la empresa|soporte))?"
+    r"[\s?!.,]*$"
+    r"|^[\s¿¡]*c[oó]mo (?:los|les|te) (?:contacto|puedo contactar)[\s?!.,]*$",
+    re.IGNORECASE
+)
+
+# Solo preguntas por la fecha u hora actual; "¿a qué hora abren?" o "¿qué hora es en Madrid?" van al orchestrator
+_TIME_RE = re.compile(
+    r"^[\s¿¡]*"
+    r"(?:qu[eé] (?:hora es|d[ií]a es(?: hoy)?|fecha es(?: hoy)?)"
+    r"|(?:me (?:dices|das|puedes decir) )?(?:la )?(?:hora|fecha)(?: actual| de hoy)?"
+    r"|what time is it)"
+    r"(?:,? por favor)?[\s?!.,]*$",
+    re.IGNORECASE
+)
+
+_CANNED_RESPONSES = {
+    "greeting": "¡Hola! 👋 Soy tu asistente de servicio al cliente. ¿En qué puedo ayudarte hoy?",
+    "thanks": "¡Con gusto! 😊 Si necesitas algo más, aquí estoy para ayudarte.",
+    "farewell": "👋 ¡Gracias por contactarnos! Que tengas un excelente día.",
+    "contact": """📞 **Datos de contacto de soporte:**
+- Teléfono: +1-234-567-8900
+- Email: soporte@empresa.com
+
+¿Hay algo más en lo que pueda ayudarte?""",
+}
+
+def _current_time_response() -> str:
+    """Respuesta con la fecha y hora actual (mismo formato que la herramienta get_current_time)."""
+    return f"🕒 La fecha y hora actual es {time.strftime('%Y-%m-%d %H:%M:%S')}."
+
+# Intenciones cuya respuesta se construye al momento de responder
+_RESPONSE_BUILDERS = {
+    "time": _current_time_response,
+}
+
+_INTENT_PATTERNS = (
+    ("greeting", _GREETING_RE),
+    ("thanks", _THANKS_RE),
+    ("farewell", _FAREWELL_RE),
+    ("contact", _CONTACT_RE),
+    ("time", _TIME_RE),
+)
+
+def route_trivial_intent(message: str) -> Optional[str]:
+    """
+    Resuelve intenciones triviales sin invocar al LLM.
+    
+    Args:
+        message: Mensaje del cliente
+        
+    Returns:
+        Optional[str]: Respuesta predefinida, o None si el mensaje requiere al orchestrator
+    """
+    for intent, pattern in _INTENT_PATTERNS:
+        if pattern.match(message):
+            orchestrator_logger.info("🎯 ORCHESTRATOR ROUTING: Intent '%s' answered without LLM | Message: '%s'", intent, message)
+            builder = _RESPONSE_BUILDERS.get(intent)
+            return builder() if builder is not None else _CANNED_RESPONSES[intent]
+    return None
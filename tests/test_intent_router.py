@@ -0,0 +1,71 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from intent_router import _CANNED_RESPONSES, route_trivial_intent
+
+
+class RouteTrivialIntentTest(unittest.TestCase):
+
+    def assertRoutedTo(self, message, intent):
+        self.assertEqual(route_trivial_intent(message), _CANNED_RESPONSES[intent], message)
+
+    def assertNotRouted(self, message):
+        self.assertIsNone(route_trivial_intent(message), message)
+
+    def test_greetings(self):
+        for message in ("hola", "Hola!", "¡Hola!", "buenas tardes", "  Buenos días. "):
+            self.assertRoutedTo(message, "greeting")
+
+    def test_thanks_and_farewell(self):
+        for message in ("gracias", "Muchas gracias!", "mil gracias"):
+            self.assertRoutedTo(message, "thanks")
+        for message in ("adiós", "Hasta luego!", "bye"):
+            self.assertRoutedTo(message, "farewell")
+
+    def test_contact_questions(self):
+        for message in (
+            "¿Cuál es el teléfono de soporte?",
+            "teléfono de contacto",
+            "me das el correo de soporte?",
+            "¿Cuáles son sus datos de contacto?",
+            "¿Cómo los contacto?",
+        ):
+            self.assertRoutedTo(message, "contact")
+
+    def test_current_time_questions(self):
+        for message in ("¿Qué hora es?", "que dia es hoy", "fecha actual", "me dices la hora?", "What time is it?"):
+            response = route_trivial_intent(message)
+            self.assertIsNotNone(response, message)
+            self.assertTrue(response.startswith("🕒 La fecha y hora actual es "), message)
+
+    def test_scheduling_questions_go_to_orchestrator(self):
+        for message in (
+            "¿A qué hora abren?",
+            "¿Qué hora es en Madrid?",
+            "Quiero cambiar la fecha de entrega",
+        ):
+            self.assertNotRouted(message)
+
+    def test_greeting_followed_by_a_question_goes_to_orchestrator(self):
+        self.assertNotRouted("hola, quiero devolver un producto")
+        self.assertNotRouted("gracias, y cuánto tarda el envío?")
+
+    def test_updates_to_the_customer_contact_details_go_to_orchestrator(self):
+        for message in (
+            "Quiero actualizar mi número de contacto a 5551234",
+            "Necesito cambiar el correo de contacto de mi cuenta",
+            "mis datos de contacto están mal",
+            "quiero cambiar mi email",
+        ):
+            self.assertNotRouted(message)
+
+    def test_regular_questions_go_to_orchestrator(self):
+        self.assertNotRouted("¿Cuál es la política de devoluciones?")
+        self.assertNotRouted("")
+
+
+if __name__ == "__main__":
+    unittest.main()
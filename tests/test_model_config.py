@@ -0,0 +1,29 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import customer_service_agent
+except ImportError:
+    # strands-agents / boto3 not installed
+    customer_service_agent = None
+
+
+@unittest.skipIf(customer_service_agent is None, "requires strands-agents and boto3")
+class CreateModelBedrockTest(unittest.TestCase):
+
+    def test_client_uses_the_latency_optimized_region(self):
+        model = customer_service_agent.create_model_bedrock()
+        self.assertEqual(model.client.meta.region_name, customer_service_agent.BEDROCK_CONFIG_REGION)
+        self.assertEqual(model.client.meta.region_name, "us-east-2")
+
+    def test_client_applies_the_configured_timeouts(self):
+        client_config = customer_service_agent.create_model_bedrock().client.meta.config
+        self.assertEqual(client_config.connect_timeout, customer_service_agent.BEDROCK_CLIENT_CONFIG["connect_timeout"])
+        self.assertEqual(client_config.read_timeout, customer_service_agent.BEDROCK_CLIENT_CONFIG["read_timeout"])
+
+
+if __name__ == "__main__":
+    unittest.main()